@@ -0,0 +1,362 @@
+"""
+Benchmarks for curling. Run them all with::
+
+    python -m curling.bench
+
+Or just some of them by passing their names. Nothing needs to be running,
+the throughput benchmark starts its own server.
+
+To compare versions, save the results from one and compare the other to
+them::
+
+    python -m curling.bench --save before.json
+    python -m curling.bench --compare before.json
+"""
+import argparse
+import BaseHTTPServer
+import datetime
+import decimal
+import json
+import os
+import platform
+import SocketServer
+import subprocess
+import sys
+import threading
+import time
+import timeit
+from multiprocessing.pool import ThreadPool
+
+try:
+    from collections import OrderedDict
+except ImportError:  # Python 2.6.
+    from ordereddict import OrderedDict
+
+import oauth2 as oauth
+
+from curling import lib
+from curling.command import percentile
+from curling.encoder import CODECS, get_codec
+from curling.fake import FakeTransport
+from curling.hooks import Aggregator
+from curling.signing import Signer
+
+URL = 'http://localhost:8001/generic/buyer/'
+
+# The number of threads making requests in the throughput benchmark.
+CONCURRENCY = (1, 4, 16)
+
+# The number of requests for each level of concurrency.
+REQUESTS = 500
+
+
+def measure(func, number=1000, repeat=3):
+    """Returns the best time for one call to func, in microseconds."""
+    best = min(timeit.Timer(func).repeat(repeat, number))
+    return best / number * 1000000
+
+
+def sign(callback, extra):
+    def call():
+        callback(None, extra=extra, headers={}, method='GET',
+                 params={'uuid': 'some-uuid', 'limit': 20}, url=URL)
+    return call
+
+
+def bench_signing():
+    """OAuth signing of one request."""
+    key, secret = 'key', 'secret'
+    return [
+        ('oauth2', sign(lib.sign_request, {'key': key, 'secret': secret})),
+        ('oauth2, cached consumer',
+         sign(lib.sign_request, {'key': key, 'secret': secret,
+                                 'consumer': oauth.Consumer(key, secret)})),
+        ('fast', sign(lib.fast_sign_request, {'signer': Signer(key, secret)})),
+    ]
+
+
+def bench_navigation():
+    """Navigating to api.generic.buyer(pk).transaction."""
+    cached = lib.API('http://localhost:8001')
+    uncached = lib.API('http://localhost:8001')
+    uncached._store['resources'] = None
+    return [
+        ('uncached', lambda: uncached.generic.buyer(1).transaction),
+        ('cached', lambda: cached.generic.buyer(1).transaction),
+    ]
+
+
+def transactions(count):
+    """A Tastypie list of count transactions."""
+    return {
+        'meta': {'limit': count, 'offset': 0, 'total_count': count,
+                 'next': None, 'previous': None},
+        'objects': [{'amount': decimal.Decimal('10.00'),
+                     'created': datetime.datetime(2013, 10, 1, 12, 30, 5),
+                     'currency': 'USD',
+                     'resource_uri': '/generic/transaction/%s/' % i,
+                     'status': 1,
+                     'uuid': 'transaction-uuid-%s' % i} for i in range(count)]
+    }
+
+
+def bench_json():
+    """Encoding and decoding a list of 100 transactions."""
+    data = transactions(100)
+    res = []
+    for name in sorted(CODECS.keys()):
+        try:
+            codec = get_codec(name)
+        except ImportError:
+            continue
+        encoded = codec.dumps(data)
+        res.append(('%s dumps' % name, lambda c=codec: c.dumps(data)))
+        res.append(('%s loads' % name, lambda c=codec: c.loads(encoded)))
+    return res
+
+
+def decoded(count):
+    """A list of count transactions, as it is after decoding the JSON."""
+    return json.loads(get_codec('json').dumps(transactions(count)))
+
+
+def bench_format_list():
+    """Formatting a list of 100 transactions."""
+    data = decoded(100)
+    res = []
+    for compact in (False, True, 'records'):
+        api = lib.API('http://localhost:8001', compact=compact)
+        resource = api.generic.transaction
+        res.append(('compact=%s' % compact,
+                    lambda r=resource: r._format_list(data)))
+    return res
+
+
+def sizeof(obj, seen=None):
+    """Roughly the bytes used by obj and everything it refers to."""
+    seen = set() if seen is None else seen
+    if id(obj) in seen or isinstance(obj, type):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for k, v in obj.iteritems():
+            size += sizeof(k, seen) + sizeof(v, seen)
+    elif isinstance(obj, (list, tuple)):
+        for item in obj:
+            size += sizeof(item, seen)
+    if hasattr(obj, '__dict__'):
+        size += sizeof(obj.__dict__, seen)
+    for slot in getattr(type(obj), '__slots__', ()):
+        size += sizeof(getattr(obj, slot, None), seen)
+    return size
+
+
+def bench_memory():
+    """The memory used by a list of 10000 transactions, once it's read."""
+    res = []
+    for compact in (False, True, 'records'):
+        resource = lib.API('http://localhost:8001',
+                           compact=compact).generic.transaction
+        tpl = resource._format_list(decoded(10000))
+        for obj in tpl:
+            pass
+        res.append(('compact=%s' % compact, {'KB': sizeof(tpl) / 1024.0}))
+    return res
+
+
+def bench_request():
+    """
+    A GET of 20 transactions without a network. MockAPI doesn't decode the
+    response, the fake transport does.
+    """
+    codec = get_codec('json')
+    lib.mock_lookup['GET:http://localhost:8001/generic/buyer/'] = (
+        codec.loads(codec.dumps(transactions(20))))
+    transport = FakeTransport()
+    transport.add('GET', r'^/generic/buyer/$', body=transactions(20))
+    fake = lib.API('http://localhost:8001', transport=transport)
+
+    plain = lib.MockAPI('http://localhost:8001')
+    hooks = lib.MockAPI('http://localhost:8001', hooks=[Aggregator()])
+    signed = lib.MockAPI('http://localhost:8001')
+    signed.activate_oauth('key', 'secret', fast=True)
+    return [
+        ('plain', lambda: plain.generic.buyer.get()),
+        ('hooks', lambda: hooks.generic.buyer.get()),
+        ('signed', lambda: signed.generic.buyer.get()),
+        ('fake transport', lambda: fake.generic.buyer.get()),
+    ]
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answers every GET with the same Tastypie list."""
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    body = get_codec('json').dumps(transactions(20))
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+def serve():
+    """Starts a stub server on a free port, call shutdown to stop it."""
+    server = Server(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def load(resource, count, concurrency):
+    """
+    Makes count GETs to resource on concurrency threads, returns the
+    latency percentiles in milliseconds and the requests per second.
+    """
+    def call(_):
+        start = time.time()
+        resource.get()
+        return (time.time() - start) * 1000
+
+    pool = ThreadPool(concurrency)
+    start = time.time()
+    try:
+        latencies = sorted(pool.map(call, range(count)))
+    finally:
+        pool.close()
+    elapsed = time.time() - start
+    return OrderedDict([
+        ('p50 ms', percentile(latencies, 50)),
+        ('p90 ms', percentile(latencies, 90)),
+        ('p99 ms', percentile(latencies, 99)),
+        ('req/s', count / elapsed),
+    ])
+
+
+def bench_throughput():
+    """GETs to a local server, at different levels of concurrency."""
+    server = serve()
+    url = 'http://127.0.0.1:%s' % server.server_address[1]
+    res = []
+    try:
+        for concurrency in CONCURRENCY:
+            api = lib.API(url, pool_maxsize=concurrency)
+            # Warm up the connections.
+            load(api.generic.buyer, concurrency, concurrency)
+            res.append(('concurrency %s' % concurrency,
+                        load(api.generic.buyer, REQUESTS, concurrency)))
+            api._store['session'].close()
+    finally:
+        server.shutdown()
+        server.server_close()
+    return res
+
+
+# Runs the command the way the console script does.
+HELP = ('import sys; sys.argv = ["curling", "--help"]; '
+        'from curling.command import main; main()')
+
+
+def startup(args, runs=10):
+    """The best time in milliseconds to run python with args."""
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join(
+        filter(None, [root, env.get('PYTHONPATH')]))
+    best = None
+    with open(os.devnull, 'w') as null:
+        for run in range(runs):
+            start = time.time()
+            subprocess.check_call([sys.executable] + args, env=env,
+                                  stdout=null)
+            elapsed = (time.time() - start) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+    return {'ms': best}
+
+
+def bench_startup():
+    """Starting the curling command, in a new process each time."""
+    return [
+        ('python', startup(['-c', 'pass'])),
+        ('import curling.command', startup(['-c', 'import curling.command'])),
+        ('curling --help', startup(['-c', HELP])),
+    ]
+
+
+BENCHMARKS = {
+    'format_list': bench_format_list,
+    'json': bench_json,
+    'memory': bench_memory,
+    'navigation': bench_navigation,
+    'request': bench_request,
+    'signing': bench_signing,
+    'startup': bench_startup,
+    'throughput': bench_throughput,
+}
+
+
+def run(name, number):
+    """
+    Runs a benchmark, returns a dict of label to metrics. Benchmarks return
+    either functions, which are timed, or the metrics they measured.
+    """
+    res = OrderedDict()
+    for label, func in BENCHMARKS[name]():
+        if callable(func):
+            res[label] = {'us': measure(func, number)}
+        else:
+            res[label] = func
+    return res
+
+
+def compare(value, old):
+    if not old:
+        return ''
+    return '%10.2f %+7.1f%%' % (old, (value - old) / old * 100)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--number', default=1000, type=int,
+                        help='calls per timing')
+    parser.add_argument('--save', help='save the results to this file')
+    parser.add_argument('--compare',
+                        help='compare with the results saved in this file')
+    parser.add_argument('names', nargs='*', help='benchmarks to run')
+    config = parser.parse_args()
+
+    previous = {}
+    if config.compare:
+        with open(config.compare) as saved:
+            previous = json.load(saved)['results']
+
+    results = {}
+    for name in config.names or sorted(BENCHMARKS.keys()):
+        print '%s: %s' % (name, BENCHMARKS[name].__doc__.strip())
+        results[name] = run(name, config.number)
+        for label, metrics in results[name].items():
+            for metric, value in metrics.items():
+                old = previous.get(name, {}).get(label, {}).get(metric)
+                print '  %-30s %10.2f %-6s %s' % (
+                    label, value, metric, compare(value, old))
+
+    if config.save:
+        with open(config.save, 'w') as saved:
+            json.dump({'date': datetime.datetime.now().isoformat(),
+                       'python': platform.python_version(),
+                       'results': results}, saved, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+import collections
+import threading
+import time
+
+from slumber.exceptions import HttpServerError
+
+from cache import LocMemCache
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+
+class CircuitOpen(HttpServerError):
+    """Raised instead of making a request to an endpoint that's failing."""
+
+
+class Circuit(object):
+    """The state of the requests to one endpoint."""
+
+    def __init__(self, window):
+        self.state = CLOSED
+        self.opened = None
+        self.results = collections.deque(maxlen=window)
+        self.lock = threading.Lock()
+
+
+class CircuitBreaker(object):
+    """
+    Stops making requests to an endpoint when too many of its recent
+    requests have failed or been slow, so that callers fail fast rather than
+    waiting on it.
+
+    threshold: the fraction of bad requests that opens the circuit
+    window: the number of recent requests to look at
+    min_requests: don't open the circuit until there have been this many
+    slow: requests that take longer than this many seconds count as bad
+    reset_timeout: after this many seconds, one request is let through to
+        see if the endpoint has recovered. If it works the circuit is closed,
+        otherwise it stays open for another reset_timeout
+    exception: raised when the circuit is open
+    size: the number of endpoints to remember
+    """
+
+    def __init__(self, threshold=0.5, window=20, min_requests=10, slow=None,
+                 reset_timeout=30, exception=CircuitOpen, size=1000):
+        self.threshold = threshold
+        self.window = window
+        self.min_requests = min_requests
+        self.slow = slow
+        self.reset_timeout = reset_timeout
+        self.exception = exception
+        self._circuits = LocMemCache(size=size, ttl=None)
+        self._lock = threading.Lock()
+
+    def circuit(self, key):
+        with self._lock:
+            circuit = self._circuits.get(key)
+            if circuit is None:
+                circuit = Circuit(self.window)
+                self._circuits.set(key, circuit)
+            return circuit
+
+    def state(self, key):
+        return self.circuit(key).state
+
+    def allow(self, key):
+        """Returns True if a request can be made to the endpoint."""
+        circuit = self.circuit(key)
+        with circuit.lock:
+            if circuit.state == CLOSED:
+                return True
+            if circuit.opened + self.reset_timeout > time.time():
+                return False
+            # Let one request through and wait on the result.
+            circuit.state = HALF_OPEN
+            circuit.opened = time.time()
+            return True
+
+    def record(self, key, ok, elapsed):
+        """Records the result of a request to the endpoint."""
+        bad = not ok or (self.slow is not None and elapsed > self.slow)
+        circuit = self.circuit(key)
+        with circuit.lock:
+            if circuit.state == HALF_OPEN:
+                if bad:
+                    circuit.state = OPEN
+                    circuit.opened = time.time()
+                else:
+                    circuit.state = CLOSED
+                    circuit.results.clear()
+                return
+
+            circuit.results.append(bad)
+            if (circuit.state == CLOSED and
+                    len(circuit.results) >= self.min_requests and
+                    (float(sum(circuit.results)) / len(circuit.results) >=
+                     self.threshold)):
+                circuit.state = OPEN
+                circuit.opened = time.time()
@@ -0,0 +1,190 @@
+import hashlib
+import sys
+import threading
+import time
+import urllib
+
+try:
+    from collections import OrderedDict
+except ImportError:  # Python 2.6.
+    from ordereddict import OrderedDict
+
+
+def cache_key(method, url, params=None):
+    """Produce a standard key for a request, used by the response caches."""
+    query = urllib.urlencode(sorted((params or {}).items()), doseq=True)
+    return '%s:%s?%s' % (method, url, query)
+
+
+class CachedResponse(object):
+    """
+    A response body, as it came from the server, along with the validators
+    that came with it.
+    """
+
+    def __init__(self, content, headers=None, etag=None, last_modified=None):
+        self.content = content
+        self.headers = headers or {}
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def conditional_headers(self):
+        """The headers to send to ask the server if this is still valid."""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class BaseCache(object):
+    """
+    The interface for response caches. Subclass this for something different.
+    """
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class LocMemCache(BaseCache):
+    """
+    An in process LRU cache, evicting the least recently used entry once
+    there are more than `size` entries and anything older than `ttl` seconds.
+    """
+
+    def __init__(self, size=1000, ttl=300):
+        self.size = size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                expires, value = self._data.pop(key)
+            except KeyError:
+                return None
+            if self.ttl is not None and expires < time.time():
+                return None
+            # Put it back at the end, so it's the most recently used.
+            self._data[key] = (expires, value)
+            return value
+
+    def set(self, key, value):
+        expires = time.time() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (expires, value)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DjangoCache(BaseCache):
+    """
+    Stores responses using the Django cache framework, in the cache called
+    `alias`. Keys are hashed so they are safe for memcached.
+    """
+
+    def __init__(self, alias='default', ttl=None, prefix='curling'):
+        self.alias = alias
+        self.ttl = ttl
+        self.prefix = prefix
+
+    @property
+    def cache(self):
+        try:
+            from django.core.cache import caches
+            return caches[self.alias]
+        except ImportError:  # Django < 1.7.
+            from django.core.cache import get_cache
+            return get_cache(self.alias)
+
+    def _key(self, key):
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        return '%s:%s' % (self.prefix, hashlib.md5(key).hexdigest())
+
+    def get(self, key):
+        return self.cache.get(self._key(key))
+
+    def set(self, key, value):
+        if self.ttl is None:
+            self.cache.set(self._key(key), value)
+        else:
+            self.cache.set(self._key(key), value, self.ttl)
+
+    def delete(self, key):
+        self.cache.delete(self._key(key))
+
+    def clear(self):
+        # Clearing the whole Django cache would remove other peoples data.
+        raise NotImplementedError('Use the Django cache directly.')
+
+
+class Call(object):
+    """A call that's in progress, that others can wait for."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Makes sure only one call for a key is in progress at a time, anyone else
+    asking for the same key waits for that call and gets its result.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        """
+        Returns the result of func and whether it came from someone else's
+        call. If func raises an error, everyone waiting gets that error.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error:
+                raise call.error[0], call.error[1], call.error[2]
+            return call.result, True
+
+        try:
+            call.result = func()
+        except:
+            call.error = sys.exc_info()
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result, False
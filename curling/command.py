@@ -1,32 +1,45 @@
 import argparse
+import collections
 import json
+import math
 import mimetypes
 import os
 import sys
 import tempfile
+import threading
+import time
 import urlparse
 import webbrowser
-
-from pygments import highlight
-try:
-    from pygments.lexers import JSONLexer as lexer
-except ImportError:
-    from pygments.lexers import JsonLexer as lexer
-
-from pygments.formatters import Terminal256Formatter
+from multiprocessing.pool import ThreadPool
 
 import requests
 from slumber.exceptions import HttpClientError
 
 import lib
 
+# The parsed config files, by filename, with the time they were changed.
+_configs = {}
+
+
+def read_config(full):
+    """Returns the parsed config file, parsing it again only if it changed."""
+    try:
+        mtime = os.path.getmtime(full)
+    except OSError:
+        return None
+    cached = _configs.get(full)
+    if cached is None or cached[0] != mtime:
+        with open(full, 'r') as config:
+            cached = _configs[full] = (mtime, json.load(config))
+    return cached[1]
+
 
 def get_config():
     conf = {}
     for filename in ['.curling', '~/.curling']:
-        full = os.path.expanduser(filename)
-        if os.path.exists(full):
-            conf = json.load(open(full, 'r'))
+        full = read_config(os.path.expanduser(filename))
+        if full is not None:
+            conf = full
     return conf
 
 
@@ -34,10 +47,90 @@ def get_domain(domain):
     return get_config().get(domain)
 
 
+# Output bigger than this many bytes isn't highlighted, pygments is too slow.
+HIGHLIGHT_LIMIT = 1024 * 1024
+
+
+def highlight(text):
+    # pygments is only imported when there is something to highlight.
+    from pygments import highlight
+    try:
+        from pygments.lexers import JSONLexer as lexer
+    except ImportError:
+        from pygments.lexers import JsonLexer as lexer
+    from pygments.formatters import Terminal256Formatter
+
+    return highlight(text, lexer(), Terminal256Formatter(bg='dark'))
+
+
 def show(data):
     res = json.dumps(data, indent=2)
-    out = highlight(res, lexer(), Terminal256Formatter(bg='dark'))
-    print out
+    if len(res) > HIGHLIGHT_LIMIT:
+        print res
+    else:
+        print highlight(res)
+
+
+class Output(object):
+    """
+    Writes JSON values as they come, highlighting them until more than
+    limit bytes have been written.
+    """
+
+    def __init__(self, out, limit=None):
+        self.out = out
+        self.limit = HIGHLIGHT_LIMIT if limit is None else limit
+        self.size = 0
+
+    def text(self, text):
+        self.out.write(text)
+
+    def value(self, value, indent=0):
+        res = json.dumps(value, indent=2)
+        if indent:
+            res = res.replace('\n', '\n' + ' ' * indent)
+        self.size += len(res)
+        if self.size <= self.limit:
+            res = highlight(res).rstrip('\n')
+        self.out.write(res)
+
+
+def show_stream(res, out=None):
+    """
+    Pretty prints a TastypieStream as it is read. A response that isn't a
+    list is printed as it would be by show.
+    """
+    out = out or sys.stdout
+    if res.meta is None and res.extra:
+        return show(res.extra)
+
+    output = Output(out)
+    output.text('{\n')
+    meta = res.meta
+    if meta is not None:
+        output.text('  "meta": ')
+        output.value(meta, 2)
+        output.text(', \n')
+    output.text('  "objects": [')
+    for count, obj in enumerate(res):
+        output.text(', \n    ' if count else '\n    ')
+        output.value(obj, 4)
+    output.text('\n  ]')
+    if meta is None and res.meta is not None:
+        # The meta came after the objects.
+        output.text(', \n  "meta": ')
+        output.value(res.meta, 2)
+    output.text('\n}\n')
+
+
+def show_raw(res, out=None):
+    """Prints each object in a TastypieStream as JSON on its own line."""
+    out = out or sys.stdout
+    if res.meta is None and res.extra:
+        res = [res.extra]
+    for obj in res:
+        out.write(json.dumps(obj))
+        out.write('\n')
 
 
 def show_text(data, content_type='text/plain'):
@@ -53,20 +146,34 @@ def show_text(data, content_type='text/plain'):
         webbrowser.open('file://%s' % name)
 
 
-def new(config):
-    url = urlparse.urlparse(config.url)
-    api = lib.API('{0}://{1}'.format(url.scheme, url.netloc))
+def make_api(url, **kw):
+    """Returns an API for the host of url, with OAuth if it's configured."""
+    # There are no metrics from the command, so don't set up statsd.
+    lib.statsd = lib.NullStatsd()
+    url = urlparse.urlparse(url)
+    api = lib.API('{0}://{1}'.format(url.scheme, url.netloc), **kw)
 
     local = get_domain(url.netloc)
     if local:
         api.activate_oauth(local['key'], local['secret'])
+    return api
+
 
-    for path in url.path.split('/'):
+def get_resource(api, url):
+    for path in urlparse.urlparse(url).path.split('/'):
         api = getattr(api, path)
+    return api
 
+
+def new(config):
+    api = get_resource(make_api(config.url), config.url)
     method = getattr(api, config.request.lower())
 
     try:
+        if config.raw:
+            return show_raw(api.stream())
+        if config.stream:
+            return show_stream(api.stream())
         res = method(data=config.data)
     except HttpClientError, err:
         res = {
@@ -106,16 +213,149 @@ def old(config):
     show_text(res.content, content_type=ctype)
 
 
+def percentile(values, percent):
+    """The nearest rank percentile of sorted values."""
+    rank = int(math.ceil(percent / 100.0 * len(values))) - 1
+    return values[max(0, rank)]
+
+
+def read_targets(config):
+    """
+    Returns a list of the urls to request and the data to send to each. The
+    file of urls has a url on each line, optionally followed by a space and
+    the JSON to send. Raises ValueError if there are none, or the JSON can't
+    be parsed.
+    """
+    data = json.loads(config.data) if config.data else None
+    if not config.urls:
+        return [(config.url, data)]
+
+    targets = []
+    with open(config.urls) as urls:
+        for line in urls:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            parts = line.split(None, 1)
+            targets.append((parts[0],
+                            json.loads(parts[1]) if len(parts) > 1 else data))
+    if not targets:
+        raise ValueError('there are no urls in %s' % config.urls)
+    return targets
+
+
+class Status(lib.Hook):
+    """Remembers the status of the last response in each thread."""
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def post_response(self, event):
+        self.local.status = event.status_code
+
+
+def load(config, targets=None):
+    """
+    Makes number requests, concurrency at a time, and prints how long they
+    took and the status of the responses. Without a number, each url is
+    requested once. targets is from read_targets, which is called if not.
+    """
+    status = Status()
+    method = config.request.lower()
+    apis, calls = {}, []
+    for url, data in targets or read_targets(config):
+        parsed = urlparse.urlparse(url)
+        if parsed.netloc not in apis:
+            apis[parsed.netloc] = make_api(url, hooks=[status],
+                                           pool_maxsize=config.concurrency)
+        calls.append((getattr(get_resource(apis[parsed.netloc], url), method),
+                      data, dict(urlparse.parse_qsl(parsed.query))))
+    number = config.number or len(calls)
+    start = time.time()
+
+    def call(index):
+        request, data, params = calls[index % len(calls)]
+        if config.rate:
+            wait = start + index / config.rate - time.time()
+            if wait > 0:
+                time.sleep(wait)
+        status.local.status = None
+        begin = time.time()
+        try:
+            request(data=data, **params)
+        except (lib.HttpClientError, lib.HttpServerError):
+            pass
+        except (ValueError, requests.RequestException):
+            # A body that can't be parsed, or a bad url.
+            status.local.status = None
+        return (time.time() - begin) * 1000, status.local.status or 'error'
+
+    pool = ThreadPool(config.concurrency)
+    try:
+        results = list(pool.imap_unordered(call, range(number)))
+    finally:
+        pool.close()
+    report(results, time.time() - start, config)
+
+
+def report(results, elapsed, config):
+    latencies = sorted(latency for latency, status in results)
+    statuses = collections.defaultdict(int)
+    for latency, status in results:
+        statuses[status] += 1
+    print 'Requests:     %s' % len(results)
+    print 'Concurrency:  %s' % config.concurrency
+    print 'Time:         %.2f s' % elapsed
+    if not results:
+        return
+    print 'Throughput:   %.1f requests/s' % (len(results) / elapsed
+                                             if elapsed else 0)
+    print 'Latency (ms): min %.1f, p50 %.1f, p90 %.1f, p99 %.1f, max %.1f' % (
+        latencies[0], percentile(latencies, 50), percentile(latencies, 90),
+        percentile(latencies, 99), latencies[-1])
+    print 'Statuses:'
+    for status, count in sorted(statuses.items()):
+        print '  %-6s %8s  %5.1f%%' % (status, count,
+                                        count * 100.0 / len(results))
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('-d', '--data', default=None, required=False)
     parser.add_argument('-X', '--request', default='GET', required=False)
     parser.add_argument('-i', '--include', action='store_true', required=False)
     parser.add_argument('-l', '--legacy', action='store_true', required=False)
-    parser.add_argument('url')
+    parser.add_argument('-n', '--number', default=None, type=int,
+                        help='make this many requests and report on them')
+    parser.add_argument('-c', '--concurrency', default=1, type=int,
+                        help='the number of requests to make at once')
+    parser.add_argument('--rate', default=None, type=float,
+                        help='the most requests to make each second')
+    parser.add_argument('--urls', default=None,
+                        help='a file of urls to request, one on each line')
+    parser.add_argument('-s', '--stream', action='store_true',
+                        help='print a list as it is read')
+    parser.add_argument('--raw', action='store_true',
+                        help='print each object in a list as JSON on its '
+                             'own line, as it is read')
+    parser.add_argument('url', nargs='?')
 
     config = parser.parse_args()
-    if config.legacy:
+    if not config.url and not config.urls:
+        parser.error('a url or --urls is required')
+    if (config.stream or config.raw) and config.request.upper() != 'GET':
+        parser.error('--stream and --raw only work with GET')
+    if config.number is not None and config.number < 1:
+        parser.error('--number must be at least 1')
+    if config.concurrency < 1:
+        parser.error('--concurrency must be at least 1')
+    if config.number or config.urls:
+        try:
+            targets = read_targets(config)
+        except ValueError, exc:
+            parser.error(str(exc))
+        load(config, targets)
+    elif config.legacy:
         old(config)
     else:
         new(config)
@@ -0,0 +1,129 @@
+import re
+
+IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+class Record(object):
+    """
+    An object from a list, with a slot for each field rather than a dict.
+    It can be read like a dict, or with attributes.
+    """
+    __slots__ = ()
+
+    def __init__(self, obj):
+        for field in self.__slots__:
+            setattr(self, field, obj[field])
+
+    def __getitem__(self, field):
+        try:
+            return getattr(self, field)
+        except AttributeError:
+            raise KeyError(field)
+
+    def __contains__(self, field):
+        return field in self.__slots__
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def __eq__(self, other):
+        if isinstance(other, (dict, Record)):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    def __ne__(self, other):
+        res = self.__eq__(other)
+        return res if res is NotImplemented else not res
+
+    def __repr__(self):
+        return '<Record %r>' % self.to_dict()
+
+    def get(self, field, default=None):
+        return getattr(self, field, default)
+
+    def keys(self):
+        return list(self.__slots__)
+
+    def items(self):
+        return [(field, getattr(self, field)) for field in self.__slots__]
+
+    def to_dict(self):
+        return dict(self.items())
+
+
+# Record classes that have been made, by their fields.
+_records = {}
+
+
+def record_class(fields):
+    """Returns a Record class with a slot for each of fields."""
+    fields = tuple(sorted(str(field) for field in fields))
+    if fields not in _records:
+        _records[fields] = type('Record', (Record,), {'__slots__': fields})
+    return _records[fields]
+
+
+def can_record(fields):
+    """Returns True if each of fields can be a slot on a Record."""
+    return all(isinstance(field, basestring) and IDENTIFIER.match(field) and
+               not hasattr(Record, field) for field in fields)
+
+
+class CompactList(object):
+    """
+    A Tastypie list that keeps the parsed objects rather than copying them,
+    with the meta available as attributes, as on TastypieList.
+
+    If records is True, each object is turned into a Record when it's first
+    used, with the fields of the first object. records can also be a list of
+    the fields, from the schema for example. Objects whose fields don't match
+    are left as dicts.
+    """
+    __slots__ = ('objects', 'meta', 'record')
+
+    def __init__(self, resp, records=False):
+        self.objects = resp['objects']
+        self.meta = resp['meta']
+        self.record = None
+        if records is True and self.objects:
+            records = self.objects[0].keys()
+        if records and can_record(records):
+            self.record = record_class(records)
+
+    def __getattr__(self, name):
+        try:
+            return self.meta[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def _item(self, index):
+        obj = self.objects[index]
+        if self.record is not None and isinstance(obj, dict):
+            if len(obj) == len(self.record.__slots__):
+                try:
+                    obj = self.objects[index] = self.record(obj)
+                except KeyError:
+                    pass
+        return obj
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._item(i)
+                    for i in xrange(*index.indices(len(self.objects)))]
+        return self._item(index)
+
+    def __iter__(self):
+        for index in xrange(len(self.objects)):
+            yield self._item(index)
+
+    def __len__(self):
+        return len(self.objects)
+
+    def __nonzero__(self):
+        return bool(self.objects)
+
+    def __repr__(self):
+        return '<CompactList of %s>' % len(self.objects)
@@ -0,0 +1,86 @@
+import zlib
+
+from requests.packages.urllib3.response import HTTPResponse
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Methods whose bodies can be compressed.
+METHODS = ('POST', 'PUT', 'PATCH')
+
+# Encodings that requests decodes itself, even when streaming. Newer
+# versions of urllib3 decode br and zstd as well, if they can.
+BUILTIN = tuple(e for e in getattr(HTTPResponse, 'CONTENT_DECODERS',
+                                   ('gzip', 'deflate')))
+
+
+def _zstd(data):
+    return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+
+
+def decoders():
+    """Returns the decoders of the other encodings that are installed."""
+    res = {}
+    if brotli is not None:
+        res['br'] = brotli.decompress
+    if zstandard is not None:
+        res['zstd'] = _zstd
+    return res
+
+
+class Compression(object):
+    """
+    Asks for compressed responses and compresses large request bodies.
+
+    accept: the encodings to ask for, best first. br and zstd are only asked
+        for if brotli or zstandard is installed, and not when streaming
+    threshold: gzip the bodies of POST, PUT and PATCH requests of at least
+        this many bytes, None to never compress them
+    level: the gzip compression level, from 1 to 9
+    """
+
+    def __init__(self, accept=('zstd', 'br', 'gzip', 'deflate'),
+                 threshold=1024, level=6):
+        self.decoders = decoders()
+        self.accept_encoding = ', '.join(
+            e for e in accept if e in BUILTIN or e in self.decoders)
+        self.stream_encoding = ', '.join(e for e in accept if e in BUILTIN)
+        self.threshold = threshold
+        self.level = level
+
+    def accept(self, stream=False):
+        """The Accept-Encoding header to send."""
+        return self.stream_encoding if stream else self.accept_encoding
+
+    def compress(self, method, data):
+        """Returns data gzipped, or None if it shouldn't be compressed."""
+        if (self.threshold is None or not data or
+                method.upper() not in METHODS or len(data) < self.threshold):
+            return None
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        gzip = zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return gzip.compress(data) + gzip.flush()
+
+    def decode(self, encoding, content, raw=None):
+        """
+        Returns content decoded, or None if it's in an encoding that the
+        transport has already decoded. raw is the response's raw response,
+        urllib3 has decoded anything in BUILTIN, other transports gzip and
+        deflate.
+        """
+        encoding = (encoding or '').strip().lower()
+        if encoding in ('gzip', 'deflate') or (
+                isinstance(raw, HTTPResponse) and encoding in BUILTIN):
+            return None
+        decoder = self.decoders.get(encoding)
+        if decoder is None:
+            return None
+        return decoder(content)
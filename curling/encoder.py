@@ -19,3 +19,69 @@ class Encoder(json.JSONEncoder):
 
     def default(self, v):
         return self.ENCODINGS.get(type(v), super(Encoder, self).default)(v)
+
+
+def default(v):
+    """Encodes v the same way as Encoder, for JSON libraries without cls."""
+    try:
+        return Encoder.ENCODINGS[type(v)](v)
+    except KeyError:
+        raise TypeError('%r is not JSON serializable' % (v,))
+
+
+class JsonCodec(object):
+    """Encodes and decodes using the json library."""
+    fast = True
+
+    def dumps(self, data):
+        return json.dumps(data, cls=Encoder)
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class SimpleJsonCodec(object):
+    """
+    Encodes and decodes using simplejson, which is faster if its C
+    extension is installed. Strings that are only ASCII may be decoded as
+    str, rather than unicode.
+    """
+
+    def __init__(self):
+        import simplejson
+        self.json = simplejson
+        # Without the C extension, simplejson is slower than json.
+        self.fast = simplejson.encoder.c_make_encoder is not None
+
+    def dumps(self, data):
+        # Encode Decimals and namedtuples the same way as json does.
+        return self.json.dumps(data, default=default, use_decimal=False,
+                               namedtuple_as_object=False)
+
+    def loads(self, data):
+        return self.json.loads(data)
+
+
+CODECS = {
+    'json': JsonCodec,
+    'simplejson': SimpleJsonCodec,
+}
+
+# The order to try the codecs in when picking the fastest.
+FASTEST = ('simplejson', 'json')
+
+
+def get_codec(name=None):
+    """
+    Returns a codec called name, the default is json. If name is fastest,
+    returns the fastest codec that is installed.
+    """
+    if name == 'fastest':
+        for name in FASTEST:
+            try:
+                codec = CODECS[name]()
+            except ImportError:
+                continue
+            if codec.fast:
+                return codec
+    return CODECS[name or 'json']()
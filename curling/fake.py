@@ -0,0 +1,138 @@
+import collections
+import random
+import re
+import threading
+import time
+import urlparse
+
+from requests.structures import CaseInsensitiveDict
+
+from encoder import get_codec
+
+# What's recorded about each request.
+Call = collections.namedtuple('Call', 'method url params data headers')
+
+
+class Response(object):
+    """
+    Just enough of a requests response for curling, without the cost of
+    building a real one or a Mock.
+    """
+
+    def __init__(self, status_code=200, content='', headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = CaseInsensitiveDict(headers or {})
+
+    def iter_content(self, chunk_size=1):
+        for start in xrange(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+
+NOT_FOUND = Response(404)
+
+
+def make_response(status, body, headers=None, codec=None):
+    """Returns a Response, with body encoded as JSON if it isn't a string."""
+    headers = dict(headers or {})
+    if body is None:
+        body = ''
+    elif not isinstance(body, basestring):
+        body = (codec or get_codec('json')).dumps(body)
+        headers.setdefault('Content-Type', 'application/json')
+    headers['Content-Length'] = str(len(body))
+    return Response(status, body, headers)
+
+
+class Route(object):
+    """
+    The response to requests with method (None for any) to urls whose path
+    matches the regular expression pattern.
+
+    handler: a function called with the Call that returns a Response or a
+        tuple of status and body, rather than always giving the same response
+    latency: seconds to wait before responding, or a tuple of the shortest
+        and longest, to wait a random time between them
+    error: an exception to raise, such as requests' ConnectionError or
+        Timeout, or a status to respond with
+    error_rate: the fraction of requests that get the error
+    """
+
+    def __init__(self, method, pattern, status=200, body=None, headers=None,
+                 handler=None, latency=0, error=None, error_rate=1,
+                 codec=None):
+        self.method = method.upper() if method else None
+        self.pattern = re.compile(pattern)
+        self.handler = handler
+        self.latency = latency
+        self.error = error
+        self.error_rate = error_rate
+        self.codec = codec or get_codec('json')
+        self.response = make_response(status, body, headers, self.codec)
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def matches(self, method, path):
+        return ((self.method is None or self.method == method.upper()) and
+                self.pattern.match(path) is not None)
+
+    def respond(self, call):
+        with self._lock:
+            self.count += 1
+
+        if isinstance(self.latency, tuple):
+            time.sleep(random.uniform(*self.latency))
+        elif self.latency:
+            time.sleep(self.latency)
+
+        if self.error is not None and (self.error_rate >= 1 or
+                                       random.random() < self.error_rate):
+            if isinstance(self.error, int):
+                return make_response(self.error, None)
+            raise self.error
+
+        if self.handler is None:
+            return self.response
+        res = self.handler(call)
+        if isinstance(res, tuple):
+            return make_response(res[0], res[1], codec=self.codec)
+        return res
+
+
+class FakeTransport(object):
+    """
+    Answers requests in process from a list of routes, so code using curling
+    can be load tested without a network. Pass it to the API::
+
+        fake = FakeTransport()
+        fake.add('GET', r'^/generic/buyer/$', body={'meta': {}, 'objects': []})
+        api = API('http://localhost:8001', transport=fake)
+
+    The first route that matches is used, requests that match no route get a
+    404. The last log_size requests are kept in calls.
+    """
+
+    def __init__(self, log_size=1000, codec=None):
+        self.routes = []
+        self.calls = collections.deque(maxlen=log_size)
+        self.codec = codec
+
+    def add(self, method, pattern, **kw):
+        """Adds a route, see Route for the arguments."""
+        kw.setdefault('codec', self.codec)
+        route = Route(method, pattern, **kw)
+        self.routes.append(route)
+        return route
+
+    def request(self, method, url, data=None, params=None, headers=None,
+                **kw):
+        call = Call(method, url, params, data, headers)
+        self.calls.append(call)
+        path = urlparse.urlsplit(url).path
+        for route in self.routes:
+            if route.matches(method, path):
+                return route.respond(call)
+        return NOT_FOUND
@@ -0,0 +1,151 @@
+import collections
+import contextlib
+import time
+
+
+class Event(object):
+    """
+    What's known about a request, passed to each hook.
+
+    timings: seconds spent in each phase, serialize, sign, network and
+        deserialize. sign and network are for the latest attempt
+    attempt: the number of the attempt, starting at 1
+    request_bytes, response_bytes: the size of the bodies, if known
+    """
+
+    def __init__(self, hooks, method, url, key):
+        self.hooks = hooks
+        self.method = method
+        self.url = url
+        self.key = key
+        self.attempt = 0
+        self.headers = None
+        self.timings = {}
+        self.request_bytes = 0
+        self.response_bytes = None
+        self.status_code = None
+        self.error = None
+
+    @contextlib.contextmanager
+    def timing(self, phase):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.timings[phase] = time.time() - start
+
+    def fire(self, name):
+        for hook in self.hooks:
+            getattr(hook, name)(self)
+
+
+class Hook(object):
+    """
+    Subclass this and pass it to API in hooks to be told about requests.
+    """
+
+    def pre_request(self, event):
+        """Called before each attempt, once the headers are signed."""
+
+    def post_response(self, event):
+        """Called after each attempt gets a response."""
+
+    def post_parse(self, event):
+        """Called after the response has been deserialized."""
+
+    def error(self, event):
+        """Called when a request raises an error, which is in event.error."""
+
+
+def measurements(name, event):
+    """
+    Yields the metrics that are new after the hook called name, as tuples of
+    name, 'timing' or 'count', and value. Timings are in milliseconds.
+    """
+    phases = []
+    if name == 'post_response':
+        phases = ['sign', 'network']
+        if event.attempt == 1:
+            phases.append('serialize')
+    elif name == 'post_parse':
+        phases = ['deserialize']
+
+    for phase in phases:
+        if phase in event.timings:
+            yield ('%s.%s' % (event.key, phase), 'timing',
+                   event.timings[phase] * 1000)
+
+    if name == 'post_response':
+        if event.request_bytes:
+            yield ('%s.bytes_sent' % event.key, 'count', event.request_bytes)
+        if event.response_bytes:
+            yield ('%s.bytes_received' % event.key, 'count',
+                   event.response_bytes)
+
+
+class Aggregator(Hook):
+    """
+    Keeps the metrics for requests in memory, for tests or to find out what's
+    slow.
+
+    events: a list of the hooks called, and a copy of the event at the time
+    timings: the timings for each metric, in milliseconds
+    counts: the total for each count
+    """
+
+    def __init__(self):
+        self.events = []
+        self.timings = collections.defaultdict(list)
+        self.counts = collections.defaultdict(int)
+
+    def record(self, name, event):
+        state = dict(event.__dict__)
+        state['timings'] = dict(event.timings)
+        del state['hooks']
+        self.events.append((name, state))
+        for metric, kind, value in measurements(name, event):
+            if kind == 'timing':
+                self.timings[metric].append(value)
+            else:
+                self.counts[metric] += value
+
+    def pre_request(self, event):
+        self.record('pre_request', event)
+
+    def post_response(self, event):
+        self.record('post_response', event)
+
+    def post_parse(self, event):
+        self.record('post_parse', event)
+
+    def error(self, event):
+        self.record('error', event)
+
+    def summary(self):
+        """Returns the count, mean and max of each timing."""
+        return dict((metric, {'count': len(values),
+                              'mean': sum(values) / len(values),
+                              'max': max(values)})
+                    for metric, values in self.timings.items())
+
+
+class NullTiming(object):
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *args):
+        pass
+
+null_timing = NullTiming()
+
+
+def timing(event, phase):
+    """Times phase on event, if there is one."""
+    return null_timing if event is None else event.timing(phase)
+
+
+def fire(event, name):
+    """Calls the hooks called name on event, if there is one."""
+    if event is not None:
+        event.fire(name)
@@ -0,0 +1,130 @@
+import socket
+import ssl
+import threading
+import urlparse
+
+from requests.adapters import BaseAdapter
+from requests.exceptions import ConnectionError
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+try:
+    from hyper import HTTP20Connection
+    from hyper.http20.exceptions import HTTP20Error
+    from hyper.tls import init_context
+except ImportError:
+    HTTP20Connection = None
+    HTTP20Error = None
+    init_context = None
+
+# Headers that are only about the HTTP/1.1 connection, and aren't allowed
+# in HTTP/2.
+HOP_HEADERS = ('connection', 'keep-alive', 'proxy-connection',
+               'transfer-encoding', 'upgrade')
+
+
+class HTTP2Adapter(BaseAdapter):
+    """
+    A requests adapter that sends requests over HTTP/2 with hyper. Each host
+    gets one connection, which all the requests to it share, however many
+    threads are making them.
+
+    https urls negotiate HTTP/2 with ALPN, http urls use HTTP/2 without
+    upgrading from HTTP/1.1, so the server must expect it. hyper can't time
+    out requests or use a proxy, so asking for either raises ValueError.
+    """
+    supports_timeout = False
+
+    def __init__(self):
+        if HTTP20Connection is None:
+            raise ImportError('hyper must be installed to use HTTP/2')
+        super(HTTP2Adapter, self).__init__()
+        self.connections = {}
+        self._lock = threading.Lock()
+
+    def ssl_context(self, verify, cert):
+        """Returns the SSL context for requests' verify and cert."""
+        if verify is True and cert is None:
+            return None
+        context = init_context(
+            cert_path=verify if isinstance(verify, basestring) else None,
+            cert=cert)
+        if verify is False:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        return context
+
+    def get_connection(self, scheme, host, port, verify=True, cert=None):
+        """Returns the key and connection for a host, connecting once."""
+        secure = scheme == 'https'
+        if not secure:
+            verify, cert = True, None
+        if isinstance(cert, list):
+            cert = tuple(cert)
+        key = (scheme, host, port or (443 if secure else 80), verify, cert)
+        with self._lock:
+            if key not in self.connections:
+                self.connections[key] = HTTP20Connection(
+                    host, key[2], secure=secure,
+                    ssl_context=self.ssl_context(verify, cert))
+            return key, self.connections[key]
+
+    def _drop(self, key, conn):
+        with self._lock:
+            if self.connections.get(key) is conn:
+                del self.connections[key]
+        try:
+            conn.close()
+        except (socket.error, HTTP20Error):
+            pass
+
+    def send(self, request, stream=False, timeout=None, verify=True,
+             cert=None, proxies=None):
+        url = urlparse.urlsplit(request.url)
+        if timeout is not None:
+            raise ValueError('HTTP/2 requests can\'t have a timeout')
+        if (proxies or {}).get(url.scheme):
+            raise ValueError('HTTP/2 requests can\'t use a proxy')
+        key, conn = self.get_connection(url.scheme, url.hostname, url.port,
+                                        verify, cert)
+        selector = url.path or '/'
+        if url.query:
+            selector += '?' + url.query
+        headers = dict((k, v) for k, v in request.headers.items()
+                       if k.lower() not in HOP_HEADERS)
+        try:
+            stream_id = conn.request(request.method, selector, request.body,
+                                     headers)
+            res = self.build_response(request, conn.get_response(stream_id))
+            if not stream:
+                res.content
+        except (socket.error, HTTP20Error), exc:
+            # The connection is no good for the other requests either.
+            self._drop(key, conn)
+            raise ConnectionError(exc)
+        return res
+
+    def build_response(self, request, resp):
+        res = Response()
+        res.status_code = resp.status
+        res.headers = CaseInsensitiveDict(resp.headers.iter_raw())
+        res.encoding = get_encoding_from_headers(res.headers)
+        res.reason = resp.reason
+        res.url = request.url
+        res.request = request
+        res.connection = self
+        # Closing a requests response releases the connection, but there is
+        # nothing to release when the connection is shared.
+        resp.release_conn = lambda: None
+        res.raw = resp
+        return res
+
+    def close(self):
+        with self._lock:
+            connections, self.connections = self.connections.values(), {}
+        for conn in connections:
+            try:
+                conn.close()
+            except (socket.error, HTTP20Error):
+                pass
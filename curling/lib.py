@@ -1,32 +1,81 @@
-import json
+import collections
+import itertools
 import time
 import urlparse
+from multiprocessing.pool import ThreadPool
 
 from django.conf import settings
 from django.core.exceptions import (ImproperlyConfigured,
                                     MultipleObjectsReturned,
                                     ObjectDoesNotExist)
 
-import mock
-import oauth2 as oauth
-
-try:
-    from django_statsd.clients import statsd
-except (ImportError, ImproperlyConfigured):
-    statsd = mock.MagicMock()
-
-from requests.exceptions import ConnectionError
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, Timeout
+from requests.packages.urllib3.poolmanager import PoolManager
 
 from slumber.exceptions import HttpClientError, HttpServerError  # NOQA
 from slumber import exceptions
 from slumber import API as SlumberAPI, Resource, url_join
 from slumber import serialize
 
-from encoder import Encoder
+from cache import CachedResponse, LocMemCache, SingleFlight, cache_key
+from compact import CompactList
+from encoder import get_codec
+from fake import Response as FakeResponse
+from hooks import Event, Hook, fire, measurements, null_timing, timing
+from signing import Signer
+from stream import TastypieStream
+
+
+def _nothing(*args, **kw):
+    pass
+
+
+class NullStatsd(object):
+    """A statsd client that does nothing, for when there isn't one."""
+
+    def timer(self, *args, **kw):
+        return null_timing
+
+    def __getattr__(self, name):
+        return _nothing
+
+
+class LazyStatsd(object):
+    """
+    Imports the statsd client the first time it's used, because importing
+    django_statsd sets up Django, which is slow.
+    """
+
+    def __getattr__(self, name):
+        global statsd
+        if isinstance(statsd, LazyStatsd):
+            try:
+                from django_statsd.clients import statsd
+            except (ImportError, ImproperlyConfigured):
+                statsd = NullStatsd()
+        return getattr(statsd, name)
+
+statsd = LazyStatsd()
+
+# oauth2 is slow to import and not always used, so it's imported by _oauth.
+oauth = HMAC_SHA1 = None
+
+
+def _oauth():
+    """Imports oauth2 the first time it's needed."""
+    global oauth, HMAC_SHA1
+    if oauth is None:
+        import oauth2
+        HMAC_SHA1 = oauth2.SignatureMethod_HMAC_SHA1()
+        oauth = oauth2
+    return oauth
 
 
 def sign_request(slumber, extra=None, headers=None, method=None, params=None,
                  url=None, **kwargs):
+    oauth = _oauth()
     args = {'oauth_consumer_key': extra['key'],
             'oauth_nonce': oauth.generate_nonce(),
             'oauth_signature_method': 'HMAC-SHA1',
@@ -37,11 +86,21 @@ def sign_request(slumber, extra=None, headers=None, method=None, params=None,
         args.update(params)
 
     req = oauth.Request(method=method, url=url, parameters=args)
-    consumer = oauth.Consumer(extra['key'], extra['secret'])
-    req.sign_request(oauth.SignatureMethod_HMAC_SHA1(), consumer, None)
+    consumer = (extra.get('consumer') or
+                oauth.Consumer(extra['key'], extra['secret']))
+    req.sign_request(HMAC_SHA1, consumer, None)
     headers['Authorization'] = req.to_header()['Authorization']
 
 
+def fast_sign_request(slumber, extra=None, headers=None, method=None,
+                      params=None, url=None, **kwargs):
+    """
+    Gives the same result as sign_request, but without using oauth2 to
+    build the request, see curling.signing.
+    """
+    headers['Authorization'] = extra['signer'].header(method, url, params)
+
+
 #Make slumber 400 errors show the content.
 def verbose(self, *args, **kw):
     res = super(exceptions.SlumberHttpBaseException, self).__str__(*args, **kw)
@@ -63,13 +122,41 @@ class TastypieAttributesMixin(object):
         if item.startswith('_'):
             raise AttributeError(item)
 
-        kwargs = {}
-        for key, value in self._store.iteritems():
-            kwargs[key] = value
+        return self._child(item)
 
-        kwargs.update({'base_url': url_join(self._store["base_url"], item)})
+    def _child(self, item, cls=None):
+        """
+        Returns the resource for item under this one, made with cls, which
+        defaults to self._resource. If the API keeps a cache of resources,
+        each one is only made once and a copy of it is returned each time.
+        The format is part of the key, because resource(format=...) changes
+        it for the resources under it.
+        """
+        resources = self._store.get('resources')
+        if resources is None:
+            return self._make_child(item, cls)
 
-        return self._resource(**kwargs)
+        key = (self._store['base_url'], item, cls, self._store.get('format'))
+        resource = resources.get(key)
+        if resource is None:
+            resource = self._make_child(item, cls)
+            resources.set(key, resource)
+        return _shallow(resource)
+
+    def _make_child(self, item, cls=None):
+        kwargs = dict(self._store)
+        kwargs['base_url'] = url_join(self._store['base_url'], item)
+        return (cls or self._resource)(**kwargs)
+
+
+def _shallow(resource):
+    """
+    Returns a copy of resource that shares its store, so that setting
+    attributes on it, such as format_lists, doesn't change the original.
+    """
+    res = object.__new__(resource.__class__)
+    res.__dict__ = resource.__dict__.copy()
+    return res
 
 
 class TastypieList(list):
@@ -81,8 +168,14 @@ class JsonSerializer(serialize.JsonSerializer):
 
     key = 'json'
 
+    def __init__(self, codec=None):
+        self.codec = codec or get_codec()
+
     def dumps(self, data):
-        return json.dumps(data, cls=Encoder)
+        return self.codec.dumps(data)
+
+    def loads(self, data):
+        return self.codec.loads(data)
 
 
 def default_parser(url):
@@ -99,11 +192,87 @@ def default_parser(url):
     return split[1:3], split[3] or None
 
 
+def _chunks(items, size):
+    """Yields lists of up to size of items."""
+    items = iter(items)
+    while True:
+        chunk = list(itertools.islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# The result of one request of a bulk_create, bulk_update or bulk_delete. data
+# is what was sent, result is the response or, if it failed, error is the
+# HttpClientError or HttpServerError raised.
+Chunk = collections.namedtuple('Chunk', 'data result error')
+
+
+def _length(resp, stream=False):
+    """Returns the length of the response body, if it's known."""
+    length = resp.headers.get('content-length')
+    if length is not None:
+        return int(length)
+    if not stream and isinstance(resp.content, basestring):
+        return len(resp.content)
+
+
+# Keys that have already been worked out, see _key.
+_keys = {}
+
+# The number of keys to remember.
+KEY_CACHE_SIZE = 10000
+
+
 def _key(url, method):
     """Produce a standard key for clients like statsd."""
-    return '%s.%s' % (
+    try:
+        return _keys[url, method]
+    except KeyError:
+        pass
+
+    key = '%s.%s' % (
         '.'.join([u for u in urlparse.urlparse(url).path.split('/') if u]),
         method)
+    if len(_keys) >= KEY_CACHE_SIZE:
+        _keys.clear()
+    _keys[url, method] = key
+    return key
+
+
+def _sample_rate(rates, key):
+    """
+    Returns the rate for key from rates, which is either a number or a dict
+    of keys, or the start of keys, to rates.
+    """
+    if not isinstance(rates, dict):
+        return rates
+    parts = key.split('.')
+    for end in range(len(parts), 0, -1):
+        rate = rates.get('.'.join(parts[:end]))
+        if rate is not None:
+            return rate
+    return 1
+
+
+class StatsdHook(Hook):
+    """
+    Sends the time taken by each phase of a request, and the size of the
+    request and response, to statsd.
+    """
+
+    def emit(self, name, event):
+        for metric, kind, value in measurements(name, event):
+            if kind == 'timing':
+                statsd.timing(metric, value)
+            else:
+                statsd.incr(metric, value)
+
+    def post_response(self, event):
+        self.emit('post_response', event)
+
+    def post_parse(self, event):
+        self.emit('post_parse', event)
 
 
 class TastypieResource(TastypieAttributesMixin, Resource):
@@ -117,6 +286,18 @@ class TastypieResource(TastypieAttributesMixin, Resource):
         except (ImportError, ImproperlyConfigured):
             self.format_lists = False
 
+    def __call__(self, id=None, format=None, url_override=None):
+        if id is not None and format is None and url_override is None:
+            return self._child(id, self.__class__)
+        return super(TastypieResource, self).__call__(
+            id=id, format=format, url_override=url_override)
+
+    def _with_lists(self):
+        """Returns a copy of this resource that formats lists."""
+        resource = self.__class__(**self._store)
+        resource.format_lists = True
+        return resource
+
     def _is_list(self, resp):
         try:
             return set(['meta', 'objects']).issubset(set(resp.keys()))
@@ -124,6 +305,14 @@ class TastypieResource(TastypieAttributesMixin, Resource):
             return False
 
     def _format_list(self, resp):
+        compact = self._store.get('compact')
+        if compact:
+            if compact == 'records':
+                compact = True
+            elif not isinstance(compact, (list, tuple)):
+                compact = False
+            return CompactList(resp, records=compact)
+
         tpl = TastypieList(resp['objects'])
         for k, v in resp['meta'].iteritems():
             setattr(tpl, k, v)
@@ -132,6 +321,9 @@ class TastypieResource(TastypieAttributesMixin, Resource):
     def _try_to_serialize_response(self, resp):
         headers = resp.headers
         resp = super(TastypieResource, self)._try_to_serialize_response(resp)
+        return self._format_response(resp, headers)
+
+    def _format_response(self, resp, headers):
         if u'meta' in resp:
             resp[u'meta'][u'headers'] = headers
         if self.format_lists and self._is_list(resp):
@@ -141,59 +333,137 @@ class TastypieResource(TastypieAttributesMixin, Resource):
     def get(self, data=None, headers=None, **kwargs):
         """
         Allow a body in GET, because that's just fine.
-        """
-        s = self._store['serializer']
 
-        resp = self._request('GET', data=s.dumps(data) if data else None,
-                             headers=headers, params=kwargs)
+        If the API was given a cache, responses with an ETag or Last-Modified
+        header are cached. Later requests are made conditional and on a 304
+        the cached body is returned.
+
+        If the API coalesces requests, a GET that's the same as one already
+        in progress waits for that one and returns its result.
+        """
+        flights = self._store.get('flights')
+        if flights is None or data:
+            return self._get(data, headers, **kwargs)
+
+        url = self._url()
+        key = (cache_key('GET', url, kwargs),
+               tuple(sorted((headers or {}).items())), self.format_lists)
+        (resp, event), shared = flights.do(
+            key, lambda: self._fetch(data, headers, **kwargs))
+        if shared:
+            statsd.incr('%s.coalesced' % _key(url, 'GET'))
+            event = None
+        # Only the response is shared, each caller parses their own body.
+        return self._handle(resp, event)
+
+    def _get(self, data=None, headers=None, **kwargs):
+        return self._handle(*self._fetch(data, headers, **kwargs))
+
+    def _fetch(self, data=None, headers=None, **kwargs):
+        """
+        Makes the GET, using and filling the cache. Returns the response, the
+        cached one on a 304 if there is one, and the event.
+        """
+        cache = self._store.get('cache') if not data else None
+        cached = None
+        if cache is not None:
+            key = cache_key('GET', self._url(), kwargs)
+            cached = cache.get(key)
+            if cached is not None:
+                conditional = cached.conditional_headers()
+                conditional.update(headers or {})
+                headers = conditional
+
+        event = self._event('GET')
+        resp = self._request('GET',
+                             data=self._dumps(data, event) if data else None,
+                             headers=headers, params=kwargs, event=event)
+        if resp.status_code == 304 and cached is not None:
+            resp = FakeResponse(200, cached.content, cached.headers)
+        elif cache is not None and 200 <= resp.status_code <= 299:
+            self._cache_response(cache, key, resp)
+        return resp, event
+
+    def _handle(self, resp, event=None):
         if 200 <= resp.status_code <= 299:
-            return self._try_to_serialize_response(resp)
+            return self._parse(resp, event)
         elif resp.status_code == 304:
             return resp
         else:
             return
 
-    def post(self, data, headers=None, **kwargs):
-        s = self._store['serializer']
+    def _cache_response(self, cache, key, resp):
+        etag = resp.headers.get('etag')
+        last_modified = resp.headers.get('last-modified')
+        if etag or last_modified:
+            cache.set(key, CachedResponse(resp.content,
+                                          headers=dict(resp.headers),
+                                          etag=etag,
+                                          last_modified=last_modified))
 
-        resp = self._request('POST', data=s.dumps(data),
-                             headers=headers, params=kwargs)
+    def post(self, data, headers=None, **kwargs):
+        self._validate(data)
+        event = self._event('POST')
+        resp = self._request('POST', data=self._dumps(data, event),
+                             headers=headers, params=kwargs, event=event)
         if 200 <= resp.status_code <= 299:
-            return self._try_to_serialize_response(resp)
+            return self._parse(resp, event)
         else:
             # @@@ Need to be Some sort of Error Here or Something
             return
 
     def patch(self, data, headers=None, **kwargs):
-        s = self._store['serializer']
-
-        resp = self._request('PATCH', data=s.dumps(data),
-                             headers=headers, params=kwargs)
+        self._validate(data)
+        event = self._event('PATCH')
+        resp = self._request('PATCH', data=self._dumps(data, event),
+                             headers=headers, params=kwargs, event=event)
         if 200 <= resp.status_code <= 299:
-            return self._try_to_serialize_response(resp)
+            return self._parse(resp, event)
         else:
             # @@@ Need to be Some sort of Error Here or Something
             return
 
     def put(self, data, headers=None, **kwargs):
-        s = self._store['serializer']
-
-        resp = self._request('PUT', data=s.dumps(data),
-                             headers=headers, params=kwargs)
+        self._validate(data)
+        event = self._event('PUT')
+        resp = self._request('PUT', data=self._dumps(data, event),
+                             headers=headers, params=kwargs, event=event)
         if 200 <= resp.status_code <= 299:
-            return self._try_to_serialize_response(resp)
+            return self._parse(resp, event)
         else:
             return False
 
+    def _event(self, method, url=None, key=None):
+        """Returns an Event for the request, if there are any hooks."""
+        hooks = self._store.get('hooks')
+        if not hooks:
+            return None
+        url = url or self._url()
+        return Event(hooks, method, url, key or _key(url, method))
+
+    def _validate(self, data):
+        schemas = self._store.get('schemas')
+        if schemas is not None:
+            schemas.validate(self._url(), data)
+
+    def _dumps(self, data, event=None):
+        with timing(event, 'serialize'):
+            return self._store['serializer'].dumps(data)
+
+    def _parse(self, resp, event=None):
+        with timing(event, 'deserialize'):
+            res = self._try_to_serialize_response(resp)
+        fire(event, 'post_parse')
+        return res
+
     def get_object(self, **kw):
         """
         Gets an object and checks that one and only one object is returned.
 
         Similar to Django get, but called get_object because get is taken.
         """
-        self.format_lists = True
-        res = self.get(**kw)
-        if isinstance(res, list):
+        res = self._with_lists().get(**kw)
+        if isinstance(res, (list, CompactList)):
             if len(res) < 1:
                 raise ObjectDoesNotExist
             if len(res) > 1:
@@ -207,7 +477,6 @@ class TastypieResource(TastypieAttributesMixin, Resource):
 
         Similar to Djangos get_object_or_404.
         """
-        self.format_lists = True
         try:
             return self.get_object(**kw)
         except exceptions.HttpClientError, exc:
@@ -222,42 +491,256 @@ class TastypieResource(TastypieAttributesMixin, Resource):
 
         Similar to Djangos get_list_or_404.
         """
-        self.format_lists = True
-        res = self.get(**kw)
+        res = self._with_lists().get(**kw)
         if not res:
             raise ObjectDoesNotExist
         return res
 
-    def _call_request(self, method, url, data, params, headers):
-        return self._store["session"].request(method, url, data=data,
-                                              params=params, headers=headers)
+    def bulk_create(self, objects, batch_size=100, workers=4):
+        """
+        Creates objects with a PATCH to the list for each batch_size of them,
+        making up to workers requests at once. Returns a Chunk for each
+        request, in order, with the response or the error.
+        """
+        return self._bulk([{'objects': chunk}
+                           for chunk in _chunks(objects, batch_size)],
+                          workers)
 
-    def _request(self, method, data=None, params=None, headers=None):
+    def bulk_update(self, objects, batch_size=100, workers=4):
         """
-        Overwrite so we can pass through custom headers, like oauth
-        or something useful.
+        Like bulk_create, but for objects that exist, which must each have a
+        resource_uri.
         """
-        s = self._store["serializer"]
-        url = self._store["base_url"]
+        objects = list(objects)
+        for obj in objects:
+            if not obj.get('resource_uri'):
+                raise ValueError('Objects to update need a resource_uri.')
+        return self.bulk_create(objects, batch_size, workers)
+
+    def bulk_delete(self, uris, batch_size=100, workers=4):
+        """
+        Like bulk_create, but deletes the objects at uris. Objects with a
+        resource_uri can be passed instead.
+        """
+        uris = [uri if isinstance(uri, basestring) else uri['resource_uri']
+                for uri in uris]
+        return self._bulk([{'objects': [], 'deleted_objects': chunk}
+                           for chunk in _chunks(uris, batch_size)], workers)
+
+    def _bulk(self, chunks, workers):
+        def send(data):
+            try:
+                return Chunk(data, self.patch(data), None)
+            except (exceptions.HttpClientError,
+                    exceptions.HttpServerError), exc:
+                return Chunk(data, None, exc)
+
+        if not chunks:
+            return []
+        pool = ThreadPool(min(workers, len(chunks)))
+        try:
+            return pool.map(send, chunks)
+        finally:
+            pool.close()
+
+    def _call_request(self, method, url, data, params, headers, **kw):
+        kw.setdefault('timeout', self._store.get('timeout'))
+        transport = self._store.get('transport') or self._store['session']
+        return transport.request(method, url, data=data, params=params,
+                                 headers=headers, **kw)
+
+    def iterate(self, prefetch=False, **kw):
+        """
+        Yields every object in a Tastypie list, following meta.next to get
+        each page when it's needed. Pass limit to set the size of the pages.
+
+        If prefetch is True, the next page is requested in the background
+        while the current one is being used.
+        """
+        pool = ThreadPool(1) if prefetch else None
+        try:
+            page = self._get_page(kw)
+            while True:
+                next_url = page['meta'].get('next')
+                if next_url and pool:
+                    pending = pool.apply_async(self._get_page,
+                                               (self._next_params(next_url),))
+                for obj in page['objects']:
+                    yield obj
+                if not next_url:
+                    return
+                if pool:
+                    page = pending.get()
+                else:
+                    page = self._get_page(self._next_params(next_url))
+        finally:
+            if pool:
+                pool.close()
+
+    def all(self, prefetch=False, **kw):
+        """
+        Gets every object in a Tastypie list, see iterate.
+        """
+        return list(self.iterate(prefetch=prefetch, **kw))
+
+    def stream(self, chunk_size=65536, **kw):
+        """
+        Gets a Tastypie list without reading all of the response into memory
+        at once. Returns a TastypieStream, iterate over it to get each object
+        as it's parsed. The meta is on its meta attribute.
+        """
+        resp = self._request('GET', params=kw, stream=True)
+        return TastypieStream(resp.iter_content(chunk_size),
+                              headers=resp.headers)
+
+    def _get_page(self, params):
+        resp = self._request('GET', params=params)
+        page = super(TastypieResource, self)._try_to_serialize_response(resp)
+        if not self._is_list(page):
+            raise ValueError('Not a Tastypie list: %s' % self._url())
+        return page
+
+    def _next_params(self, next_url):
+        return dict(urlparse.parse_qsl(urlparse.urlparse(next_url).query))
 
+    def _url(self):
+        url = self._store["base_url"]
         if self._store["append_slash"] and not url.endswith("/"):
             url = url + "/"
-        hdrs = {"accept": s.get_content_type(),
-                "content-type": s.get_content_type()}
-        hdrs.update(headers or {})
-        for callback in self._store.get('callbacks', []):
-            callback['method'](self, data=data, extra=callback.get('extra'),
-                               headers=hdrs, method=method, params=params,
-                               url=url)
+        return url
 
+    def _request(self, method, data=None, params=None, headers=None,
+                 stream=False, event=None):
+        """
+        Overwrite so we can pass through custom headers, like oauth
+        or something useful. If stream is True, the body isn't read until
+        it's used.
+        """
+        url = self._url()
         stats_key = _key(url, method)
-        with statsd.timer(stats_key):
+        if event is None:
+            event = self._event(method, url, stats_key)
+
+        schemas = self._store.get('schemas')
+        if schemas is not None:
+            schemas.check(method, url)
+
+        compression = self._store.get('compression')
+        if compression is not None:
+            data, headers = self._compress(compression, method, data, headers,
+                                           stream, stats_key)
+
+        try:
+            resp = self._send(method, url, data, params, headers, stream,
+                              stats_key, event)
+        except exceptions.SlumberHttpBaseException, exc:
+            if event is not None:
+                event.error = exc
+                event.fire('error')
+            raise
+
+        self._ = resp
+
+        return resp
+
+    def _compress(self, compression, method, data, headers, stream,
+                  stats_key):
+        """
+        Asks for a compressed response and compresses data, if it's big
+        enough. Returns the data and headers to send.
+        """
+        headers = dict(headers or {})
+        headers.setdefault('Accept-Encoding', compression.accept(stream))
+        if not data:
+            return data, headers
+
+        rate = _sample_rate(self._store.get('sample_rate', 1), stats_key)
+        statsd.incr('%s.request_bytes.raw' % stats_key, len(data), rate=rate)
+        compressed = compression.compress(method, data)
+        if compressed is not None:
+            data = compressed
+            headers['Content-Encoding'] = 'gzip'
+        statsd.incr('%s.request_bytes.sent' % stats_key, len(data), rate=rate)
+        return data, headers
+
+    def _decompress(self, compression, resp, stream, stats_key, rate):
+        """
+        Decodes the response, if requests hasn't, and counts the bytes.
+        Returns the response to use.
+        """
+        received = resp.headers.get('content-length')
+        if received is not None:
+            statsd.incr('%s.response_bytes.received' % stats_key,
+                        int(received), rate=rate)
+        if stream:
+            return resp
+
+        content = compression.decode(resp.headers.get('content-encoding'),
+                                     resp.content, getattr(resp, 'raw', None))
+        if content is not None:
+            if isinstance(resp, requests.Response):
+                # requests makes a new response for each request.
+                resp._content = content
+            else:
+                # Others, such as a FakeTransport's, may be shared.
+                resp = FakeResponse(resp.status_code, content, resp.headers)
+        if isinstance(resp.content, basestring):
+            statsd.incr('%s.response_bytes.raw' % stats_key,
+                        len(resp.content), rate=rate)
+        return resp
+
+    def _send(self, method, url, data, params, headers, stream, stats_key,
+              event):
+        """
+        Makes the request, retrying it if need be, and raises an error for
+        4xx and 5xx responses.
+        """
+        retry = self._store.get('retry')
+        if retry is not None and not retry.allowed(method, headers):
+            retry = None
+
+        breaker = self._store.get('breaker')
+        limit = self._store.get('limit')
+
+        attempt, started = 1, time.time()
+        while True:
+            if breaker is not None and not breaker.allow(stats_key):
+                statsd.incr('%s.circuit_open' % stats_key)
+                raise breaker.exception('Circuit Open: %s' % url)
+
+            if limit is not None:
+                self._limit(limit, url, stats_key)
+
+            resp, error, start = None, None, time.time()
             try:
-                resp = self._call_request(method, url, data, params, hdrs)
+                resp = self._attempt(method, url, data, params, headers,
+                                     stream, stats_key, event)
             except ConnectionError:
-                raise exceptions.HttpServerError('Connection Error')
+                error = 'Connection Error'
+            except Timeout:
+                error = 'Timeout'
+            finally:
+                if limit is not None:
+                    limit.release(stats_key)
+                if breaker is not None:
+                    breaker.record(stats_key,
+                                   resp is not None and resp.status_code < 500,
+                                   time.time() - start)
+
+            if (retry is not None and
+                    (error or resp.status_code in retry.statuses) and
+                    retry.wait(attempt, started)):
+                if stream and resp is not None:
+                    # Read the body, so the connection goes back to the pool.
+                    resp.content
+                statsd.incr('%s.retry' % stats_key)
+                attempt += 1
+                continue
+
+            if error:
+                raise exceptions.HttpServerError(error)
+            break
 
-        statsd.incr('%s.%s' % (stats_key, resp.status_code))
         if 400 <= resp.status_code <= 499:
             raise exceptions.HttpClientError("Client Error %s: %s" %
                     (resp.status_code, url), response=resp,
@@ -267,8 +750,59 @@ class TastypieResource(TastypieAttributesMixin, Resource):
                     (resp.status_code, url), response=resp,
                     content=self._try_to_serialize_error(resp))
 
-        self._ = resp
+        return resp
 
+    def _limit(self, limit, url, stats_key):
+        """Waits until the limit allows a request to url."""
+        res = limit.acquire(stats_key)
+        if res is None:
+            statsd.incr('%s.limit_exceeded' % stats_key)
+            raise limit.exception('Limit Exceeded: %s' % url)
+
+        waited, ahead = res
+        rate = _sample_rate(self._store.get('sample_rate', 1), stats_key)
+        statsd.gauge('%s.limit.waiting' % stats_key, ahead, rate)
+        statsd.timing('%s.limit.wait' % stats_key, waited * 1000, rate)
+
+    def _attempt(self, method, url, data, params, headers, stream, stats_key,
+                 event=None):
+        """
+        Makes one attempt at a request. The callbacks are run for each one,
+        so that things like oauth are signed again.
+        """
+        s = self._store["serializer"]
+        hdrs = {"accept": s.get_content_type(),
+                "content-type": s.get_content_type()}
+        hdrs.update(headers or {})
+        with timing(event, 'sign'):
+            for callback in self._store.get('callbacks', []):
+                callback['method'](self, data=data,
+                                   extra=callback.get('extra'),
+                                   headers=hdrs, method=method,
+                                   params=params, url=url)
+
+        if event is not None:
+            event.attempt += 1
+            event.headers = hdrs
+            event.request_bytes = len(data) if data else 0
+            event.fire('pre_request')
+
+        kw = {'stream': True} if stream else {}
+        rate = _sample_rate(self._store.get('sample_rate', 1), stats_key)
+        with statsd.timer(stats_key, rate):
+            with timing(event, 'network'):
+                resp = self._call_request(method, url, data, params, hdrs,
+                                          **kw)
+
+        statsd.incr('%s.%s' % (stats_key, resp.status_code), rate=rate)
+        compression = self._store.get('compression')
+        if compression is not None:
+            resp = self._decompress(compression, resp, stream, stats_key,
+                                    rate)
+        if event is not None:
+            event.status_code = resp.status_code
+            event.response_bytes = _length(resp, stream)
+            event.fire('post_response')
         return resp
 
     def _try_to_serialize_error(self, response):
@@ -291,6 +825,7 @@ class MockAttributesMixin(TastypieAttributesMixin):
 class MockTastypieResource(MockAttributesMixin, TastypieResource):
 
     def _lookup(self, method, url, data=None, params=None, headers=None):
+        import mock
         resp = mock.Mock()
         resp.headers = {}
         content = mock.Mock()
@@ -299,11 +834,18 @@ class MockTastypieResource(MockAttributesMixin, TastypieResource):
         resp.status_code = 200
         return resp
 
-    def _call_request(self, method, url, data, params, headers):
+    def _call_request(self, method, url, data, params, headers, **kw):
         return self._lookup(method, url, data=data,
                             params=params, headers=headers)
 
 
+def _capture_errors(call):
+    try:
+        return call()
+    except (exceptions.HttpClientError, exceptions.HttpServerError), exc:
+        return exc
+
+
 class CurlingBase(object):
 
     def by_url(self, url, parser=None):
@@ -317,29 +859,184 @@ class CurlingBase(object):
             /generic/transaction/8/ > generic.transaction(8)
 
         This scheme is assuming that you've got two names and a primary key,
-        if you would like a different parser you could pass in a new one.
+        if you would like a different parser you could pass in a new one. If
+        the API has schemas, they are used to parse the URL instead.
         """
-        parser = parser or default_parser
+        parser = parser or self._parser
+        cache = self._store.get('resources')
+        key = ('by_url', parser, url)
+        if cache is not None:
+            current = cache.get(key)
+            if current is not None:
+                return _shallow(current)
+
         resources, pk = parser(url)
         current = self
         for resource in resources:
             current = getattr(current, resource)
-        return current(pk) if pk else current
+        current = current(pk) if pk else current
+        if cache is not None:
+            cache.set(key, _shallow(current))
+        return current
+
+    def _parser(self, url):
+        """Uses the schemas to parse url, if there are any."""
+        schemas = self._store.get('schemas')
+        res = schemas.parse(url) if schemas is not None else None
+        return res or default_parser(url)
+
+    def map(self, calls, workers=10):
+        """
+        Makes many requests at the same time on a pool of threads, for
+        example::
+
+            api.map([api.generic.buyer(pk).get for pk in pks])
+
+        Each call is a function that takes no arguments, use functools.partial
+        to pass some. Returns the results in the same order as the calls. If a
+        call raises HttpClientError or HttpServerError, the error is returned
+        in place of its result.
+        """
+        if not calls:
+            return []
+        pool = ThreadPool(min(workers, len(calls)))
+        try:
+            return pool.map(_capture_errors, calls)
+        finally:
+            pool.close()
+
+    def _configure(self, options):
+        """Sets up the store with the curling options."""
+        if options.get('timeout') is not None:
+            for session in (self._store['session'], options.get('transport')):
+                for adapter in getattr(session, 'adapters', {}).values():
+                    if not getattr(adapter, 'supports_timeout', True):
+                        raise ValueError('timeout can\'t be used with %r' %
+                                         adapter)
+        self._store['resources'] = make_resources()
+        if options.pop('coalesce', False):
+            self._store['flights'] = SingleFlight()
+        if options.get('schemas') is not None:
+            options['schemas'].bind(self._fetch, self._store['base_url'])
+        self._store.update(options)
+
+    def _fetch(self, url):
+        """GETs url, without checking it against the schemas."""
+        store = dict(self._store, base_url=url, schemas=None)
+        resource = self._resource(**store)
+        resource.format_lists = False
+        return resource.get()
 
     def _add_callback(self, callback_dict):
         self._store.setdefault('callbacks', [])
         self._store['callbacks'].append(callback_dict)
+        # Resources made before now won't have the callbacks.
+        if self._store.get('resources') is not None:
+            self._store['resources'].clear()
+
+    def activate_oauth(self, key, secret, fast=False):
+        """
+        Signs every request with OAuth using key and secret. If fast is True,
+        requests are signed by curling rather than the oauth2 library, which
+        is quicker and gives the same result.
+        """
+        if fast:
+            self._add_callback({
+                'method': fast_sign_request,
+                'extra': {'key': key, 'secret': secret,
+                          'signer': Signer(key, secret)}
+            })
+        else:
+            self._add_callback({
+                'method': sign_request,
+                'extra': {'key': key, 'secret': secret,
+                          'consumer': _oauth().Consumer(key, secret)}
+            })
+
+
+# The number of resources each API keeps around.
+RESOURCE_CACHE_SIZE = 1000
+
+# Keyword arguments to API that curling uses, rather than slumber.
+OPTIONS = ('breaker', 'cache', 'coalesce', 'compact', 'compression', 'hooks',
+           'limit', 'retry', 'sample_rate', 'schemas', 'timeout',
+           'transport')
+
+# Keyword arguments to API that configure the connection pool.
+POOL_OPTIONS = ('pool_connections', 'pool_maxsize', 'pool_block',
+                'max_retries', 'keep_alive', 'http2')
+
+
+def pop_options(kw, names=OPTIONS):
+    """Removes the curling options from kw and returns them."""
+    return dict((k, kw.pop(k)) for k in names if k in kw)
+
+
+class PoolAdapter(HTTPAdapter):
+    """
+    A requests adapter that lets you configure the connection pool.
+
+    pool_connections: the number of hosts to keep pools for
+    pool_maxsize: the number of connections to keep open per host
+    pool_block: wait for a free connection rather than opening more than
+        pool_maxsize connections to a host
+    max_retries: the number of times to retry failed connections
+    """
+    __attrs__ = HTTPAdapter.__attrs__ + ['pool_block']
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, pool_block=False,
+                 max_retries=0):
+        self.pool_block = pool_block
+        super(PoolAdapter, self).__init__(pool_connections, pool_maxsize)
+        self.max_retries = max_retries
+
+    def init_poolmanager(self, connections, maxsize, **kw):
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self.poolmanager = PoolManager(num_pools=connections, maxsize=maxsize,
+                                       block=self.pool_block)
+
+
+def make_session(session=None, auth=None, keep_alive=True, http2=False,
+                 **kw):
+    """
+    Returns a requests session using a PoolAdapter, configured by kw. If
+    keep_alive is False, connections are closed after each request. If http2
+    is True, requests are sent over HTTP/2 instead, with one connection to
+    each host, and kw is ignored.
+    """
+    if session is None:
+        session = requests.session()
+        session.auth = auth
+    if http2:
+        from http2 import HTTP2Adapter
+        adapter = HTTP2Adapter()
+    else:
+        adapter = PoolAdapter(**kw)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    if not keep_alive:
+        session.headers['Connection'] = 'close'
+    return session
+
+
+def make_pool(**kw):
+    pool = pop_options(kw, names=POOL_OPTIONS)
+    if pool:
+        kw['session'] = make_session(session=kw.get('session'),
+                                     auth=kw.get('auth'), **pool)
+    return kw
+
 
-    def activate_oauth(self, key, secret):
-        self._add_callback({
-            'method': sign_request,
-            'extra': {'key': key, 'secret': secret}
-        })
+def make_resources():
+    """A cache of resources, so navigating to them doesn't create new ones."""
+    return LocMemCache(size=RESOURCE_CACHE_SIZE, ttl=None)
 
 
 def make_serializer(**kw):
     serial = serialize.Serializer(default=kw.get('format', None))
-    serial.serializers['json'] = JsonSerializer()
+    codec = get_codec(kw.pop('codec', None))
+    serial.serializers['json'] = JsonSerializer(codec)
     kw.setdefault('serializer', serial)
     return kw
 
@@ -347,10 +1044,94 @@ def make_serializer(**kw):
 class API(TastypieAttributesMixin, CurlingBase, SlumberAPI):
 
     def __init__(self, *args, **kw):
-        return super(API, self).__init__(*args, **make_serializer(**kw))
+        options = pop_options(kw)
+        super(API, self).__init__(*args,
+                                  **make_serializer(**make_pool(**kw)))
+        self._configure(options)
 
 
 class MockAPI(MockAttributesMixin, CurlingBase, SlumberAPI):
 
     def __init__(self, *args, **kw):
-        return super(MockAPI, self).__init__(*args, **make_serializer(**kw))
+        options = pop_options(kw)
+        super(MockAPI, self).__init__(*args,
+                                      **make_serializer(**make_pool(**kw)))
+        self._configure(options)
+
+
+class AsyncResource(object):
+    """
+    Wraps a resource so that requests are made on a thread pool. Navigating
+    works just the same, but the request methods return an AsyncResult, call
+    get on that to wait for the result, or the error, of the request.
+    """
+    methods = ('get', 'post', 'put', 'patch', 'delete', 'get_object',
+               'get_object_or_404', 'get_list_or_404', 'all', 'bulk_create',
+               'bulk_update', 'bulk_delete')
+
+    def __init__(self, resource, pool):
+        self._resource = resource
+        self._pool = pool
+
+    @property
+    def _store(self):
+        return self._resource._store
+
+    def __getattr__(self, item):
+        if item.startswith('_'):
+            raise AttributeError(item)
+
+        attr = getattr(self._resource, item)
+        if item in self.methods:
+            return self._async(attr)
+        if isinstance(attr, Resource):
+            return AsyncResource(attr, self._pool)
+        return attr
+
+    def __call__(self, *args, **kw):
+        return AsyncResource(self._resource(*args, **kw), self._pool)
+
+    def _async(self, method):
+        def call(*args, **kw):
+            return self._pool.apply_async(method, args, kw)
+        return call
+
+
+class AsyncAPI(CurlingBase, AsyncResource):
+    """
+    An API that makes requests on a pool of worker threads, for example::
+
+        api = AsyncAPI('http://localhost:8001', workers=20)
+        results = [api.generic.buyer(pk).get() for pk in pks]
+        buyers = [result.get() for result in results]
+
+    The connection pool is sized to match the number of workers, unless you
+    pass in pool_maxsize. Call close and join, or use it in a with block, to
+    stop the workers when you're done.
+    """
+    api_class = API
+
+    def __init__(self, *args, **kw):
+        workers = kw.pop('workers', 10)
+        kw.setdefault('pool_maxsize', workers)
+        super(AsyncAPI, self).__init__(self.api_class(*args, **kw),
+                                       ThreadPool(workers))
+
+    def close(self):
+        """Stops taking requests, the ones already made still finish."""
+        self._pool.close()
+
+    def join(self):
+        """Waits for the workers to finish, after close."""
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        self.join()
+
+
+class MockAsyncAPI(AsyncAPI):
+    api_class = MockAPI
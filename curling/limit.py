@@ -0,0 +1,155 @@
+import threading
+import time
+
+from slumber.exceptions import HttpServerError
+
+
+class LimitExceeded(HttpServerError):
+    """Raised instead of making a request that the limit doesn't allow."""
+
+
+class Bucket(object):
+    """
+    One limit: a token bucket that holds up to burst requests and refills
+    at rate a second, and a count of the requests in flight.
+    """
+
+    def __init__(self, rate=None, burst=None, concurrency=None, timeout=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, rate or 0)
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.tokens = float(self.burst)
+        self.updated = time.time()
+        self.in_flight = 0
+        self.waiting = 0
+        self.lock = threading.Lock()
+        self.free = threading.Condition(self.lock)
+
+    def _take(self, deadline):
+        """
+        Takes a token, waiting for it if need be. Tokens are taken in turn,
+        so the bucket can go below zero. Returns False if it would have to
+        wait past deadline.
+        """
+        with self.lock:
+            now = time.time()
+            self.tokens = min(float(self.burst), self.tokens +
+                              (now - self.updated) * self.rate)
+            self.updated = now
+            wait = max(0, (1 - self.tokens) / self.rate)
+            if wait and deadline is not None and now + wait > deadline:
+                return False
+            self.tokens -= 1
+        if wait:
+            time.sleep(wait)
+        return True
+
+    def _enter(self, deadline):
+        """Waits for a request in flight to finish, if there are too many."""
+        with self.free:
+            while self.in_flight >= self.concurrency:
+                if deadline is None:
+                    self.free.wait()
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self.free.wait(remaining)
+            self.in_flight += 1
+            return True
+
+    def acquire(self):
+        """
+        Waits until a request can be made. Returns the number of requests
+        that were already waiting, or None if it can't be made in time.
+        """
+        deadline = None if self.timeout is None else time.time() + self.timeout
+        with self.lock:
+            ahead = self.waiting
+            self.waiting += 1
+        try:
+            if self.rate is not None and not self._take(deadline):
+                return None
+            if self.concurrency is not None and not self._enter(deadline):
+                if self.rate is not None:
+                    with self.lock:
+                        self.tokens += 1
+                return None
+        finally:
+            with self.lock:
+                self.waiting -= 1
+        return ahead
+
+    def release(self):
+        """Records that a request has finished."""
+        if self.concurrency is None:
+            return
+        with self.free:
+            self.in_flight -= 1
+            self.free.notify()
+
+
+class Limit(object):
+    """
+    Limits how hard an API is used, so as not to overload the servers.
+
+    rate: the number of requests a second
+    burst: the number of requests that can be made at once before rate
+        applies, by default a second's worth
+    concurrency: the number of requests that can be in flight at once
+    timeout: the longest to wait for the limit in seconds, None to wait as
+        long as it takes, 0 to raise exception rather than wait at all
+    endpoints: a dict of keys, or the start of keys, to dicts of any of the
+        above. Requests to those endpoints share that limit, as well as the
+        limit for the whole API
+    exception: raised when a request can't be made in time
+    """
+
+    def __init__(self, rate=None, burst=None, concurrency=None, timeout=None,
+                 endpoints=None, exception=LimitExceeded):
+        self.api = None
+        if rate is not None or concurrency is not None:
+            self.api = Bucket(rate, burst, concurrency, timeout)
+        self.endpoints = {}
+        for prefix, kw in (endpoints or {}).iteritems():
+            kw = dict(kw)
+            kw.setdefault('timeout', timeout)
+            self.endpoints[prefix] = Bucket(**kw)
+        self.exception = exception
+
+    def buckets(self, key):
+        """Returns the limits for key, the endpoint's first."""
+        res = []
+        if self.endpoints:
+            parts = key.split('.')
+            for end in range(len(parts), 0, -1):
+                bucket = self.endpoints.get('.'.join(parts[:end]))
+                if bucket is not None:
+                    res.append(bucket)
+                    break
+        if self.api is not None:
+            res.append(self.api)
+        return res
+
+    def acquire(self, key):
+        """
+        Waits until a request can be made to the endpoint key. Returns the
+        seconds waited and the number of requests that were already waiting,
+        or None if it can't be made in time.
+        """
+        start, ahead, taken = time.time(), 0, []
+        for bucket in self.buckets(key):
+            res = bucket.acquire()
+            if res is None:
+                for bucket in taken:
+                    bucket.release()
+                return None
+            taken.append(bucket)
+            ahead = max(ahead, res)
+        return time.time() - start, ahead
+
+    def release(self, key):
+        """Records that a request to the endpoint key has finished."""
+        for bucket in self.buckets(key):
+            bucket.release()
@@ -0,0 +1,131 @@
+import atexit
+import os
+import random
+import socket
+import threading
+import time
+
+from statsd import client
+
+
+class StatsClient(client.StatsClient):
+    """
+    A statsd client that adds up counters in process and sends everything
+    in batches, with many metrics to a packet, rather than a packet for each
+    metric. To use it with django_statsd, set::
+
+        STATSD_CLIENT = 'curling.metrics'
+
+    max_size: send once this many bytes are waiting, this is also the
+        biggest packet sent
+    interval: send whatever is waiting every this many seconds, from a
+        thread that's started when the first metric comes in
+    """
+
+    def __init__(self, host='localhost', port=8125, prefix=None,
+                 max_size=512, interval=1):
+        super(StatsClient, self).__init__(host, port, prefix)
+        self.max_size = max_size
+        self.interval = interval
+        self._counts = {}
+        self._lines = []
+        self._size = 0
+        self._flushed = time.time()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._stopped = threading.Event()
+        atexit.register(self.flush)
+
+    def _start(self):
+        """
+        Starts the thread that flushes every interval, if it isn't running in
+        this process. Threads don't survive a fork, so that's checked too.
+        """
+        pid = os.getpid()
+        with self._lock:
+            if self._pid == pid:
+                return
+            self._pid = pid
+        thread = threading.Thread(target=self._run)
+        thread.daemon = True
+        thread.start()
+
+    def _run(self):
+        while True:
+            # wait only returns the flag from Python 2.7.
+            self._stopped.wait(self.interval)
+            if self._stopped.is_set():
+                return
+            self.flush()
+
+    def stop(self):
+        """Stops the thread that flushes every interval."""
+        self._stopped.set()
+
+    def _stat(self, stat):
+        if self._prefix:
+            return '%s.%s' % (self._prefix, stat)
+        return stat
+
+    def incr(self, stat, count=1, rate=1):
+        """Increment a stat by `count`, this is sent on the next flush."""
+        if rate < 1 and random.random() >= rate:
+            return
+        key = (self._stat(stat), rate)
+        with self._lock:
+            if key not in self._counts:
+                self._counts[key] = 0
+                self._size += len(key[0]) + 16
+            self._counts[key] += count
+        self._maybe_flush()
+
+    def _send(self, stat, value, rate=1):
+        if rate < 1:
+            if random.random() < rate:
+                value = '%s|@%s' % (value, rate)
+            else:
+                return
+
+        line = '%s:%s' % (self._stat(stat), value)
+        with self._lock:
+            self._lines.append(line)
+            self._size += len(line) + 1
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if self._pid != os.getpid():
+            self._start()
+        if (self._size >= self.max_size or
+                time.time() - self._flushed >= self.interval):
+            self.flush()
+
+    def flush(self):
+        """Sends everything that's waiting."""
+        with self._lock:
+            lines, counts = self._lines, self._counts
+            self._lines, self._counts, self._size = [], {}, 0
+            self._flushed = time.time()
+        if not lines and not counts:
+            return
+
+        for (stat, rate), count in counts.iteritems():
+            if rate < 1:
+                lines.append('%s:%s|c|@%s' % (stat, count, rate))
+            else:
+                lines.append('%s:%s|c' % (stat, count))
+
+        packet, size = [], 0
+        for line in lines:
+            if packet and size + len(line) > self.max_size:
+                self._sendto('\n'.join(packet))
+                packet, size = [], 0
+            packet.append(line)
+            size += len(line) + 1
+        if packet:
+            self._sendto('\n'.join(packet))
+
+    def _sendto(self, data):
+        try:
+            self._sock.sendto(data.encode('ascii'), self._addr)
+        except socket.error:
+            pass
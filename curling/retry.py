@@ -0,0 +1,59 @@
+import random
+import time
+
+# Methods that can be safely sent more than once.
+IDEMPOTENT = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+
+class Retry(object):
+    """
+    How to retry requests that fail with a connection error, a timeout or
+    one of the statuses.
+
+    attempts: the most times to make a request, including the first
+    backoff: the longest wait in seconds before the first retry, this
+        doubles for each retry after that, up to max_backoff. The actual wait
+        is a random time up to that, so clients don't all retry at once
+    statuses: the response statuses to retry
+    methods: the methods to retry, other methods are only retried if they
+        have the idempotency_header
+    deadline: don't retry if that would take longer than this many seconds
+        from the start of the first request
+    """
+
+    def __init__(self, attempts=3, backoff=0.1, max_backoff=5,
+                 statuses=(502, 503, 504), methods=IDEMPOTENT,
+                 idempotency_header='Idempotency-Key', deadline=None):
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.statuses = frozenset(statuses)
+        self.methods = frozenset(methods)
+        self.idempotency_header = idempotency_header
+        self.deadline = deadline
+
+    def allowed(self, method, headers=None):
+        """Returns True if requests with method and headers can be retried."""
+        if method.upper() in self.methods:
+            return True
+        return bool(self.idempotency_header and
+                    self.idempotency_header in (headers or {}))
+
+    def delay(self, attempt):
+        """Returns how long to wait before the retry after attempt."""
+        return random.uniform(0, min(self.max_backoff,
+                                     self.backoff * 2 ** (attempt - 1)))
+
+    def wait(self, attempt, started):
+        """
+        Waits before the retry after attempt, returns False without waiting
+        if there shouldn't be one.
+        """
+        if attempt >= self.attempts:
+            return False
+        delay = self.delay(attempt)
+        if (self.deadline is not None and
+                time.time() + delay - started > self.deadline):
+            return False
+        time.sleep(delay)
+        return True
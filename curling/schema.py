@@ -0,0 +1,231 @@
+import json
+import os
+import threading
+import time
+import urlparse
+
+from slumber import url_join
+from slumber.exceptions import HttpClientError, HttpServerError
+
+from fake import Response
+
+
+class MethodNotAllowed(HttpClientError):
+    """Raised instead of making a request the schema doesn't allow."""
+
+
+class ValidationError(HttpClientError):
+    """
+    Raised instead of sending data the schema says is wrong, content is a
+    dict of the fields and their errors.
+    """
+
+
+class Schemas(object):
+    """
+    Loads the Tastypie API roots and the schema of each resource, so that
+    requests can be checked before they are made.
+
+    roots: the paths of the Tastypie APIs, relative to the base url
+    path: a file to keep the schemas in, so they are shared between processes
+    ttl: the number of seconds to keep the schemas before loading them again
+    error_ttl: the number of seconds to wait before trying again to load a
+        root or schema that couldn't be loaded
+
+    The roots are loaded when they are first needed and each schema when a
+    request is first made to its resource. If they can't be loaded, requests
+    are made without being checked.
+    """
+
+    def __init__(self, roots=('',), path=None, ttl=3600, error_ttl=60):
+        self.roots = roots
+        self.path = path
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self.base_url = None
+        self.fetch = None
+        self._endpoints = None
+        self._schemas = {}
+        self._loaded = 0
+        self._failed = {}
+        self._lock = threading.RLock()
+
+    def bind(self, fetch, base_url):
+        """Sets the function that GETs a url and the base url of the API."""
+        self.fetch = fetch
+        self.base_url = base_url
+
+    def _fresh(self, loaded):
+        return self.ttl is None or loaded + self.ttl > time.time()
+
+    def _read(self):
+        try:
+            with open(self.path) as saved:
+                data = json.load(saved)
+        except (IOError, ValueError):
+            return False
+        if not self._fresh(data['loaded']):
+            return False
+        self._endpoints = data['endpoints']
+        self._schemas = data['schemas']
+        self._loaded = data['loaded']
+        return True
+
+    def _write(self):
+        tmp = '%s.%s.tmp' % (self.path, os.getpid())
+        with open(tmp, 'w') as saved:
+            json.dump({'loaded': self._loaded, 'endpoints': self._endpoints,
+                       'schemas': self._schemas}, saved)
+        os.rename(tmp, self.path)
+
+    def _load(self, url):
+        """
+        GETs url, returning None if it fails or isn't a dict, and not trying
+        again for error_ttl seconds.
+        """
+        failed = self._failed.get(url)
+        if failed is not None and failed + self.error_ttl > time.time():
+            return None
+        try:
+            res = self.fetch(url)
+        except (HttpClientError, HttpServerError, ValueError):
+            res = None
+        if not isinstance(res, dict):
+            self._failed[url] = time.time()
+            return None
+        self._failed.pop(url, None)
+        return res
+
+    def endpoints(self):
+        """
+        Returns a dict of the path of each list to its schema url, or None if
+        the roots couldn't be loaded.
+        """
+        with self._lock:
+            if self._endpoints is not None and self._fresh(self._loaded):
+                return self._endpoints
+            if self.path and self._read():
+                return self._endpoints
+
+            endpoints = {}
+            for root in self.roots:
+                url = url_join(self.base_url, root).rstrip('/') + '/'
+                resources = self._load(url)
+                if resources is None:
+                    return None
+                for resource in resources.values():
+                    if (isinstance(resource, dict) and
+                            'list_endpoint' in resource and
+                            'schema' in resource):
+                        endpoints[resource['list_endpoint']] = (
+                            resource['schema'])
+            self._endpoints, self._schemas = endpoints, {}
+            self._loaded = time.time()
+            if self.path:
+                self._write()
+            return self._endpoints
+
+    def schema(self, endpoint):
+        """
+        Returns the schema of the list at endpoint, or None if it couldn't be
+        loaded.
+        """
+        endpoints = self.endpoints()
+        if endpoints is None:
+            return None
+        with self._lock:
+            if endpoint not in self._schemas:
+                url = urlparse.urljoin(self.base_url, endpoints[endpoint])
+                schema = self._load(url)
+                if schema is None:
+                    return None
+                self._schemas[endpoint] = schema
+                if self.path:
+                    self._write()
+            return self._schemas[endpoint]
+
+    def resolve(self, url):
+        """
+        Returns the list endpoint that url is in and the rest of the url,
+        which is the primary key for an object, or None if it's not in one.
+        """
+        endpoints = self.endpoints()
+        if endpoints is None:
+            return None
+        path = urlparse.urlsplit(url).path
+        best = None
+        for endpoint in endpoints:
+            if path.startswith(endpoint) and (best is None or
+                                              len(endpoint) > len(best)):
+                best = endpoint
+        if best is None:
+            return None
+        return best, path[len(best):].strip('/') or None
+
+    def parse(self, url):
+        """
+        Returns the resources and primary key for url, like default_parser,
+        or None if it's not in a list.
+        """
+        res = self.resolve(url)
+        if res is None:
+            return None
+        endpoint, pk = res
+        base = urlparse.urlsplit(self.base_url).path.rstrip('/')
+        return [r for r in endpoint[len(base):].split('/') if r], pk
+
+    def allowed(self, url):
+        """Returns the methods allowed on url, or None if they're not known."""
+        res = self.resolve(url)
+        if res is None:
+            return None
+        endpoint, pk = res
+        schema = self.schema(endpoint)
+        key = ('allowed_detail_http_methods' if pk
+               else 'allowed_list_http_methods')
+        if schema is None or key not in schema:
+            return None
+        return [m.upper() for m in schema[key]]
+
+    def check(self, method, url):
+        """Raises MethodNotAllowed if method can't be used on url."""
+        allowed = self.allowed(url)
+        if allowed is not None and method.upper() not in allowed:
+            raise MethodNotAllowed('Method Not Allowed %s: %s' % (method, url),
+                                   response=Response(405), content=None)
+
+    def validate(self, url, data):
+        """
+        Raises ValidationError if data has fields that aren't in the schema
+        of url, or is None for fields that can't be.
+        """
+        res = self.resolve(url)
+        if res is None:
+            return
+        schema = self.schema(res[0])
+        fields = schema.get('fields') if schema is not None else None
+        if not fields:
+            return
+
+        objects = [data]
+        if isinstance(data, dict) and 'objects' in data and not res[1]:
+            # A PATCH to a list, to change many objects at once.
+            objects = data['objects']
+
+        errors = {}
+        for obj in objects:
+            if not isinstance(obj, dict):
+                continue
+            for name, value in obj.iteritems():
+                field = fields.get(name)
+                if field is None:
+                    error = 'Unknown field.'
+                elif value is None and not field.get('nullable', True):
+                    error = 'This field cannot be null.'
+                else:
+                    continue
+                if error not in errors.setdefault(name, []):
+                    errors[name].append(error)
+        if errors:
+            raise ValidationError('Invalid data: %s' % url,
+                                  response=Response(400), content=errors)
@@ -0,0 +1,122 @@
+import json
+
+WHITESPACE = ' \t\n\r'
+
+# Drop the parsed part of the buffer once it gets this big.
+TRIM = 65536
+
+
+class Reader(object):
+    """
+    Reads JSON values one at a time from an iterator of chunks of a JSON
+    document, keeping only the unparsed part of the document in memory.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = ''
+        self.pos = 0
+        self.done = False
+        self.decoder = json.JSONDecoder()
+
+    def more(self):
+        """Reads the next chunk, returns False if there are none left."""
+        if self.done:
+            return False
+        if self.pos > TRIM:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        for chunk in self.chunks:
+            if chunk:
+                self.buffer += chunk
+                return True
+        self.done = True
+        return False
+
+    def peek(self):
+        """Returns the next character that isn't whitespace."""
+        while True:
+            while (self.pos < len(self.buffer) and
+                   self.buffer[self.pos] in WHITESPACE):
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.more():
+                raise ValueError('Unexpected end of JSON')
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError('Expected %r at %s' % (char, self.pos))
+        self.pos += 1
+
+    def value(self):
+        """Returns the next JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                if not self.more():
+                    raise
+                continue
+            # A number might carry on in the next chunk, so only trust the
+            # value if something comes after it.
+            if end < len(self.buffer) or not self.more():
+                self.pos = end
+                return value
+
+
+# Marks that there are no objects left.
+END = object()
+
+
+class TastypieStream(object):
+    """
+    A Tastypie list that's parsed as it's read. Iterate over it to get the
+    objects.
+
+    The list is read up to the first object straight away, so meta is set if
+    it comes before the objects, as it does from Tastypie. Other keys are
+    kept in extra, so for a response that isn't a list that has all of it.
+    """
+
+    def __init__(self, chunks, headers=None):
+        self.meta = None
+        self.extra = {}
+        self.headers = headers
+        self._objects = self._parse(Reader(chunks))
+        self._first = next(self._objects, END)
+
+    def __iter__(self):
+        first, self._first = self._first, END
+        if first is not END:
+            yield first
+        for obj in self._objects:
+            yield obj
+
+    def _parse(self, reader):
+        reader.expect('{')
+        if reader.peek() == '}':
+            return
+        while True:
+            key = reader.value()
+            reader.expect(':')
+            if key == 'objects':
+                reader.expect('[')
+                if reader.peek() == ']':
+                    reader.pos += 1
+                else:
+                    while True:
+                        yield reader.value()
+                        if reader.peek() == ']':
+                            reader.pos += 1
+                            break
+                        reader.expect(',')
+            elif key == 'meta':
+                self.meta = reader.value()
+                self.meta[u'headers'] = self.headers
+            else:
+                self.extra[key] = reader.value()
+            if reader.peek() == '}':
+                return
+            reader.expect(',')
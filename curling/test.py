@@ -1,6 +1,17 @@
+import collections
+import datetime
 import decimal
+import functools
+import itertools
 import json
+import os
+import StringIO
+import tempfile
+import threading
+import time
 import unittest
+import zlib
+from multiprocessing.pool import ThreadPool
 
 from django.conf import settings
 
@@ -17,13 +28,31 @@ if not settings.configured:
 
 from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
 import mock
+import oauth2 as oauth
 from nose.tools import eq_, ok_, raises
 from django_statsd.clients import get_client
 
 import lib
 lib.statsd = get_client()
+from breaker import CircuitBreaker, CircuitOpen
+import command
+from cache import DjangoCache, LocMemCache, SingleFlight
+from compact import CompactList, Record, record_class
+from compression import Compression
+from encoder import CODECS, JsonCodec, get_codec
+from fake import FakeTransport, Response
+from hooks import Aggregator
+import http2
+from limit import Bucket, Limit, LimitExceeded
+from metrics import StatsClient
+from retry import Retry
+from schema import MethodNotAllowed, Schemas, ValidationError
+from signing import Signer
+from stream import TastypieStream
 
-from requests.exceptions import ConnectionError
+import requests
+from requests.exceptions import ConnectionError, Timeout
+from requests.packages.urllib3.response import HTTPResponse
 
 # Some samples for the Mock.
 samples = {
@@ -137,6 +166,49 @@ class TestOAuth(unittest.TestCase):
             mock.ANY)
 
 
+    @mock.patch('curling.lib.MockTastypieResource._call_request')
+    def test_fast(self, _call_request):
+        self.api.activate_oauth('key', 'secret', fast=True)
+        self.api.services.settings.get(foo='bar')
+        ok_(_call_request.call_args[0][4]['Authorization']
+            .startswith('OAuth realm=""'))
+
+
+class TestSigner(unittest.TestCase):
+
+    def headers(self, url, params):
+        res = []
+        for sign in [lib.sign_request, lib.fast_sign_request]:
+            headers = {}
+            sign(None, extra={'key': 'key', 'secret': 's&cret',
+                              'signer': Signer('key', 's&cret')},
+                 headers=headers, method='get', params=params, url=url)
+            res.append(oauth.Request._split_header(headers['Authorization']))
+        return res
+
+    @mock.patch('time.time', mock.Mock(return_value=1381000000))
+    @mock.patch('oauth2.generate_nonce')
+    @mock.patch('curling.signing.generate_nonce')
+    def test_same(self, nonce, oauth_nonce):
+        nonce.return_value = oauth_nonce.return_value = '12345678'
+        for url, params in [
+                ('http://foo.com/a/', None),
+                ('https://foo.com:443/a/?b=c+d', {'limit': 20}),
+                ('http://foo.com:80/a b/', {u'f\xf6': u'b\xe5r ~/',
+                                            'x': ['1', '2']})]:
+            old, new = self.headers(url, params)
+            eq_(old, new)
+
+    def test_verify(self):
+        url = 'http://foo.com/a/'
+        header = Signer('key', 'secret').header('GET', url, {'b': 'c'})
+        req = oauth.Request.from_request('GET', url, query_string='b=c',
+                                         headers={'Authorization': header})
+        server = oauth.Server()
+        server.add_signature_method(oauth.SignatureMethod_HMAC_SHA1())
+        server.verify_request(req, oauth.Consumer('key', 'secret'), None)
+
+
 class TestCallable(unittest.TestCase):
 
     def setUp(self):
@@ -190,3 +262,1668 @@ class TestStatsd(unittest.TestCase):
     def test_patch(self):
         self.api.services.settings.patch(data={}, headers={})
         eq_(lib.statsd.cache, {'services.settings.PATCH.200|count': [[1, 1]]})
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = LocMemCache(size=2)
+        self.api = lib.MockAPI('http://foo.com', cache=self.cache)
+        self.body = {'key': 'APPEND_SLASH'}
+
+    def response(self, status_code=200, etag='"abc"'):
+        return mock.Mock(status_code=status_code,
+                         content=json.dumps(self.body),
+                         headers={'content-type': 'application/json',
+                                  'etag': etag})
+
+    @mock.patch('curling.lib.MockTastypieResource._call_request')
+    def test_conditional(self, _call_request):
+        _call_request.return_value = self.response()
+        eq_(self.api.services.settings.get(), self.body)
+        eq_(len(self.cache), 1)
+
+        _call_request.return_value = self.response(status_code=304)
+        eq_(self.api.services.settings.get(), self.body)
+        eq_(_call_request.call_args[0][4]['If-None-Match'], '"abc"')
+
+    @mock.patch('curling.lib.MockTastypieResource._call_request')
+    def test_copied(self, _call_request):
+        _call_request.return_value = self.response()
+        first = self.api.services.settings.get()
+        first['key'] = 'changed'
+
+        _call_request.return_value = self.response(status_code=304)
+        second = self.api.services.settings.get()
+        eq_(second, self.body)
+        second['key'] = 'changed'
+        eq_(self.api.services.settings.get(), self.body)
+
+    @mock.patch('curling.lib.MockTastypieResource._call_request')
+    def test_params(self, _call_request):
+        _call_request.return_value = self.response()
+        self.api.services.settings.get(foo='bar')
+        self.api.services.settings.get(foo='baz')
+        ok_('If-None-Match' not in _call_request.call_args[0][4])
+        eq_(len(self.cache), 2)
+
+    @mock.patch('curling.lib.MockTastypieResource._call_request')
+    def test_no_validators(self, _call_request):
+        _call_request.return_value = self.response(etag=None)
+        self.api.services.settings.get()
+        eq_(len(self.cache), 0)
+
+    @mock.patch('curling.lib.MockTastypieResource._call_request')
+    def test_304_not_cached(self, _call_request):
+        _call_request.return_value = self.response(status_code=304)
+        res = self.api.services.settings.get(headers={'If-None-Match': 'x'})
+        eq_(res.status_code, 304)
+
+    def test_lru(self):
+        for key in ['a', 'b', 'a', 'c']:
+            self.cache.set(key, key)
+        eq_(self.cache.get('b'), None)
+        eq_(self.cache.get('a'), 'a')
+
+    @mock.patch('curling.cache.time.time')
+    def test_ttl(self, time):
+        time.return_value = 0
+        self.cache.set('a', 'a')
+        time.return_value = self.cache.ttl + 1
+        eq_(self.cache.get('a'), None)
+
+    def test_django(self):
+        cache = DjangoCache()
+        cache.set(u'GET:/f\xf6/', 'a')
+        eq_(cache.get(u'GET:/f\xf6/'), 'a')
+        cache.delete(u'GET:/f\xf6/')
+        eq_(cache.get(u'GET:/f\xf6/'), None)
+
+
+class TestPool(unittest.TestCase):
+
+    def test_default(self):
+        api = lib.API('http://foo.com')
+        ok_(not isinstance(api._store['session'].adapters['http://'],
+                           lib.PoolAdapter))
+
+    def test_pool(self):
+        api = lib.API('http://foo.com', pool_maxsize=50, pool_block=True)
+        adapter = api._store['session'].adapters['https://']
+        eq_(adapter._pool_maxsize, 50)
+        eq_(adapter.poolmanager.connection_pool_kw,
+            {'maxsize': 50, 'block': True})
+
+    def test_shared(self):
+        api = lib.API('http://foo.com', pool_maxsize=50)
+        eq_(api.generic.buyer(1)._store['session'], api._store['session'])
+
+    def test_keep_alive(self):
+        api = lib.API('http://foo.com', keep_alive=False)
+        eq_(api._store['session'].headers['Connection'], 'close')
+
+    def test_session(self):
+        session = requests.session()
+        api = lib.API('http://foo.com', session=session, max_retries=3)
+        eq_(api._store['session'], session)
+        eq_(session.adapters['http://'].max_retries, 3)
+
+    @mock.patch('requests.sessions.Session.request')
+    def test_timeout(self, request):
+        request.return_value = mock.Mock(status_code=204, headers={},
+                                         content='')
+        api = lib.API('http://foo.com', timeout=2.5)
+        api.services.settings.get()
+        eq_(request.call_args[1]['timeout'], 2.5)
+
+    @raises(lib.HttpServerError)
+    @mock.patch('requests.sessions.Session.request')
+    def test_timeout_error(self, request):
+        request.side_effect = Timeout
+        lib.API('http://foo.com', timeout=2.5).services.settings.get()
+
+
+class TestAsync(unittest.TestCase):
+
+    def setUp(self):
+        self.api = lib.MockAsyncAPI('', workers=2)
+
+    def tearDown(self):
+        self.api.close()
+        self.api.join()
+
+    def test_get(self):
+        res = self.api.services.settings('APPEND_SLASH').get()
+        eq_(res.get(), samples['GET:/services/settings/APPEND_SLASH/'])
+
+    def test_list(self):
+        eq_(len(self.api.services.settings.get_list_or_404().get()), 2)
+
+    def test_by_url(self):
+        eq_(len(self.api.by_url('/services/settings/').get().get()), 2)
+
+    @raises(ObjectDoesNotExist)
+    def test_error(self):
+        self.api.services.nothing.get_object().get()
+
+    @mock.patch('curling.lib.MockTastypieResource._call_request')
+    def test_oauth(self, _call_request):
+        api = lib.MockAsyncAPI('http://foo.com')
+        api.activate_oauth('key', 'secret')
+        api.services.settings.get().get()
+        ok_('Authorization' in _call_request.call_args[0][4])
+
+    def test_pool(self):
+        with lib.AsyncAPI('http://foo.com', workers=20) as api:
+            eq_(api._store['session'].adapters['http://']._pool_maxsize, 20)
+
+    def test_close(self):
+        with lib.MockAsyncAPI('', workers=2) as api:
+            res = api.services.settings('APPEND_SLASH').get()
+            pool = api._pool
+        ok_(res.ready())
+        ok_(not any(worker.is_alive() for worker in pool._pool))
+
+
+class TestMap(unittest.TestCase):
+
+    def setUp(self):
+        self.api = lib.MockAPI('')
+
+    def test_map(self):
+        res = self.api.map([self.api.services.settings('APPEND_SLASH').get,
+                            self.api.services.settings.get,
+                            self.api.services.nothing.get])
+        eq_(res[0], samples['GET:/services/settings/APPEND_SLASH/'])
+        eq_(len(res[1]), 2)
+        eq_(len(res[2]), 0)
+
+    def test_empty(self):
+        eq_(self.api.map([]), [])
+
+    @mock.patch('curling.lib.MockTastypieResource._call_request')
+    def test_errors(self, _call_request):
+        ok = mock.Mock(status_code=204, headers={}, content='')
+        _call_request.side_effect = [ok, ConnectionError, ok]
+        res = self.api.map([self.api.services.settings.get] * 3, workers=1)
+        eq_(res[0], '')
+        ok_(isinstance(res[1], lib.HttpServerError))
+        eq_(res[2], '')
+
+    @raises(ObjectDoesNotExist)
+    def test_other_errors(self):
+        self.api.map([self.api.services.nothing.get_object])
+
+
+class TestIterate(unittest.TestCase):
+
+    def setUp(self):
+        self.api = lib.MockAPI('http://foo.com')
+        self.pages = {
+            '0': {'meta': {'next': '/services/settings/?limit=2&offset=2'},
+                  'objects': [{'key': 'a'}, {'key': 'b'}]},
+            '2': {'meta': {'next': '/services/settings/?limit=2&offset=4'},
+                  'objects': [{'key': 'c'}, {'key': 'd'}]},
+            '4': {'meta': {'next': None},
+                  'objects': [{'key': 'e'}]},
+        }
+
+    def page(self, method, url, data, params, headers):
+        page = self.pages[params.get('offset', '0')]
+        return mock.Mock(status_code=200, content=json.dumps(page),
+                         headers={'content-type': 'application/json'})
+
+    def keys(self, objects):
+        return [o['key'] for o in objects]
+
+    @mock.patch('curling.lib.MockTastypieResource._call_request')
+    def test_iterate(self, _call_request):
+        _call_request.side_effect = self.page
+        res = self.api.services.settings.iterate(limit=2)
+        eq_(self.keys(res), ['a', 'b', 'c', 'd', 'e'])
+        eq_(_call_request.call_args_list[0][0][3], {'limit': 2})
+        eq_(_call_request.call_args_list[2][0][3],
+            {'limit': '2', 'offset': '4'})
+
+    @mock.patch('curling.lib.MockTastypieResource._call_request')
+    def test_lazy(self, _call_request):
+        _call_request.side_effect = self.page
+        res = self.api.services.settings.iterate()
+        eq_(res.next(), {'key': 'a'})
+        eq_(_call_request.call_count, 1)
+
+    @mock.patch('curling.lib.MockTastypieResource._call_request')
+    def test_prefetch(self, _call_request):
+        _call_request.side_effect = self.page
+        res = self.api.services.settings.all(prefetch=True)
+        eq_(self.keys(res), ['a', 'b', 'c', 'd', 'e'])
+        eq_(_call_request.call_count, 3)
+
+    @raises(ValueError)
+    def test_not_list(self):
+        lib.MockAPI('').services.settings('APPEND_SLASH').all()
+
+
+class TestResources(unittest.TestCase):
+
+    def setUp(self):
+        self.api = lib.MockAPI('http://foo.com')
+
+    def same(self, first, second):
+        return first._store is second._store
+
+    def test_same(self):
+        ok_(self.same(self.api.services.settings, self.api.services.settings))
+        ok_(self.same(self.api.services.settings(1),
+                      self.api.services.settings(1)))
+        ok_(not self.same(self.api.services.settings(1),
+                          self.api.services.settings(2)))
+
+    def test_by_url(self):
+        ok_(self.same(self.api.by_url('/services/settings/1/'),
+                      self.api.services.settings('1')))
+        ok_(self.same(self.api.by_url('/services/settings/1/'),
+                      self.api.by_url('/services/settings/1/')))
+
+    def test_format(self):
+        eq_(self.api.services.settings._store['format'], 'json')
+        resource = self.api.services(format='xml').settings
+        eq_(resource._store['format'], 'xml')
+        eq_(resource(1)._store['format'], 'xml')
+        eq_(self.api.services.settings._store['format'], 'json')
+
+    def test_not_shared(self):
+        resource = self.api.services.settings
+        resource.format_lists = False
+        resource._ = 'response'
+        ok_(self.api.services.settings.format_lists)
+        ok_(not hasattr(self.api.services.settings, '_'))
+        by_url = self.api.by_url('/services/settings/1/')
+        by_url.format_lists = False
+        ok_(self.api.by_url('/services/settings/1/').format_lists)
+
+    def test_subclass(self):
+        class Resource(lib.MockTastypieResource):
+            pass
+
+        resource = Resource(**self.api.services.settings._store)
+        ok_(isinstance(resource(1), Resource))
+        ok_(isinstance(resource(1), Resource))
+
+    @mock.patch('curling.lib.RESOURCE_CACHE_SIZE', 2)
+    def test_bounded(self):
+        api = lib.MockAPI('http://foo.com')
+        api.services.settings(1)
+        eq_(len(api._store['resources']), 2)
+        api.services.settings(2)
+        eq_(len(api._store['resources']), 2)
+
+    @mock.patch('curling.lib.MockTastypieResource._call_request')
+    def test_callback_after(self, _call_request):
+        self.api.services.settings.get()
+        self.api.activate_oauth('key', 'secret')
+        self.api.services.settings.get()
+        ok_('Authorization' in _call_request.call_args[0][4])
+
+    def test_format_lists(self):
+        api = lib.MockAPI('')
+        resource = api.services.settings('APPEND_SLASH')
+        resource.format_lists = False
+        resource.get_object()
+        eq_(resource.format_lists, False)
+
+
+class TestCodec(unittest.TestCase):
+
+    def setUp(self):
+        self.data = {'amount': decimal.Decimal('1.10'),
+                     'created': datetime.datetime(2013, 10, 1, 12, 30, 5),
+                     'date': datetime.date(2013, 10, 1),
+                     'time': datetime.time(12, 30, 5)}
+
+    def test_default(self):
+        ok_(isinstance(get_codec(), JsonCodec))
+
+    def codecs(self):
+        for name in CODECS:
+            try:
+                yield get_codec(name)
+            except ImportError:
+                pass
+
+    def test_same(self):
+        for codec in self.codecs():
+            eq_(json.loads(codec.dumps(self.data)),
+                {'amount': '1.10', 'created': '2013-10-01 12:30:05',
+                 'date': '2013-10-01', 'time': '12:30:05'})
+            eq_(codec.loads('{"a": [1, 2.5]}'), {'a': [1, 2.5]})
+
+    def test_unknown(self):
+        for codec in self.codecs():
+            self.assertRaises(TypeError, codec.dumps, object())
+
+    def test_fastest(self):
+        ok_(get_codec('fastest').__class__ in CODECS.values())
+
+    def test_fastest_without_speedups(self):
+        try:
+            import simplejson
+        except ImportError:
+            return
+        with mock.patch.object(simplejson.encoder, 'c_make_encoder', None):
+            ok_(isinstance(get_codec('fastest'), JsonCodec))
+
+    def test_namedtuple(self):
+        Point = collections.namedtuple('Point', 'a b')
+        for codec in self.codecs():
+            eq_(json.loads(codec.dumps({'x': Point(1, 2)})), {'x': [1, 2]})
+
+    @mock.patch('curling.lib.MockTastypieResource._lookup')
+    def test_api(self, lookup):
+        api = lib.MockAPI('', codec='fastest')
+        api.services.settings.post(self.data)
+        eq_(json.loads(lookup.call_args[1]['data'])['amount'], '1.10')
+
+
+class TestStream(unittest.TestCase):
+
+    def setUp(self):
+        self.api = lib.MockAPI('http://foo.com')
+        self.data = {'meta': {'limit': 20, 'total_count': 3},
+                     'objects': [{'key': u'f\xf6', 'value': 1.5},
+                                 {'key': 'b', 'value': [1, {'c': None}]},
+                                 {'key': 'c', 'value': 12345}]}
+
+    def chunks(self, data, size):
+        return [data[i:i + size] for i in range(0, len(data), size)]
+
+    def test_chunks(self):
+        data = json.dumps(self.data, indent=1)
+        for size in [1, 3, 7, 1000]:
+            res = TastypieStream(self.chunks(data, size))
+            eq_(res.meta['total_count'], 3)
+            eq_(list(res), self.data['objects'])
+
+    def test_objects_first(self):
+        data = '{"objects": [{"a": 1}], "meta": {"limit": 1}}'
+        res = TastypieStream(self.chunks(data, 4))
+        eq_(list(res), [{'a': 1}])
+        eq_(res.meta['limit'], 1)
+
+    def test_numbers(self):
+        res = TastypieStream(['{"objects": [12', '345, 6', '7]}'])
+        eq_(list(res), [12345, 67])
+
+    def test_empty(self):
+        eq_(list(TastypieStream(['{"meta": {}, "objects": []}'])), [])
+        eq_(list(TastypieStream(['{}'])), [])
+
+    @raises(ValueError)
+    def test_truncated(self):
+        list(TastypieStream(['{"meta": {}, "objects": [{"a": 1}, {"a"']))
+
+    def test_trim(self):
+        data = json.dumps({'objects': [{'a': 'x' * 100}] * 2000})
+        with mock.patch('curling.stream.TRIM', 1000):
+            res = TastypieStream(self.chunks(data, 500))
+            eq_(len(list(res)), 2000)
+
+    @mock.patch('curling.lib.MockTastypieResource._call_request')
+    def test_api(self, _call_request):
+        resp = mock.Mock(status_code=200, headers={})
+        resp.iter_content.return_value = self.chunks(json.dumps(self.data), 5)
+        _call_request.return_value = resp
+        res = self.api.services.settings.stream(limit=20)
+        eq_(_call_request.call_args[0][3], {'limit': 20})
+        eq_(_call_request.call_args[1], {'stream': True})
+        eq_(res.meta['headers'], {})
+        eq_(len(list(res)), 3)
+
+
+@mock.patch('curling.retry.time.sleep')
+class TestRetry(unittest.TestCase):
+
+    def setUp(self):
+        self.api = lib.MockAPI('http://foo.com', retry=Retry(attempts=3))
+        self.ok = mock.Mock(status_code=200, headers={}, content='')
+        self.error = mock.Mock(status_code=503, headers={}, content='')
+        lib.statsd.reset()
+
+    @mock.patch('curling.lib.MockTastypieResource._call_request')
+    def test_status(self, _call_request, sleep):
+        _call_request.side_effect = [self.error, self.error, self.ok]
+        eq_(self.api.services.settings.get(), '')
+        eq_(_call_request.call_count, 3)
+        eq_(sleep.call_count, 2)
+        eq_(lib.statsd.cache['services.settings.GET.retry|count'],
+            [[1, 1], [1, 1]])
+
+    @raises(lib.HttpServerError)
+    @mock.patch('curling.lib.MockTastypieResource._call_request')
+    def test_gives_up(self, _call_request, sleep):
+        _call_request.return_value = self.error
+        try:
+            self.api.services.settings.get()
+        finally:
+            eq_(_call_request.call_count, 3)
+
+    @mock.patch('curling.lib.MockTastypieResource._call_request')
+    def test_connection_error(self, _call_request, sleep):
+        _call_request.side_effect = [ConnectionError, Timeout, self.ok]
+        eq_(self.api.services.settings.get(), '')
+
+    @raises(lib.HttpServerError)
+    @mock.patch('curling.lib.MockTastypieResource._call_request')
+    def test_post(self, _call_request, sleep):
+        _call_request.side_effect = [self.error, self.ok]
+        self.api.services.settings.post({})
+
+    @mock.patch('curling.lib.MockTastypieResource._call_request')
+    def test_post_idempotent(self, _call_request, sleep):
+        _call_request.side_effect = [self.error, self.ok]
+        self.api.services.settings.post({},
+                                        headers={'Idempotency-Key': 'a'})
+        eq_(_call_request.call_count, 2)
+
+    @raises(lib.HttpClientError)
+    @mock.patch('curling.lib.MockTastypieResource._call_request')
+    def test_client_error(self, _call_request, sleep):
+        _call_request.side_effect = [mock.Mock(status_code=404, headers={},
+                                               content=''), self.ok]
+        self.api.services.settings.get()
+
+    @mock.patch('curling.lib.MockTastypieResource._call_request')
+    def test_signs_again(self, _call_request, sleep):
+        _call_request.side_effect = [self.error, self.ok]
+        self.api.activate_oauth('key', 'secret')
+        self.api.services.settings.get()
+        # Each attempt has a new nonce.
+        eq_(len(set(c[0][4]['Authorization']
+                    for c in _call_request.call_args_list)), 2)
+
+    @raises(lib.HttpServerError)
+    @mock.patch('curling.retry.time.time')
+    @mock.patch('curling.lib.MockTastypieResource._call_request')
+    def test_deadline(self, _call_request, time, sleep):
+        time.return_value = 10
+        self.api._store['retry'] = Retry(deadline=1, backoff=5)
+        _call_request.side_effect = [self.error, self.ok]
+        with mock.patch('curling.retry.random.uniform', return_value=5):
+            self.api.services.settings.get()
+
+    def test_delay(self, sleep):
+        retry = Retry(backoff=1, max_backoff=3)
+        with mock.patch('curling.retry.random.uniform') as uniform:
+            for attempt in [1, 2, 3]:
+                retry.delay(attempt)
+            eq_([c[0][1] for c in uniform.call_args_list], [1, 2, 3])
+
+
+class TestBreaker(unittest.TestCase):
+
+    def setUp(self):
+        self.breaker = CircuitBreaker(min_requests=2, window=4,
+                                      reset_timeout=10)
+        self.api = lib.MockAPI('http://foo.com', breaker=self.breaker)
+        self.ok = mock.Mock(status_code=200, headers={}, content='')
+        self.error = mock.Mock(status_code=500, headers={}, content='')
+        self.key = 'services.settings.GET'
+
+    def fail(self, count=2):
+        for x in range(count):
+            self.assertRaises(lib.HttpServerError,
+                              self.api.services.settings.get)
+
+    @mock.patch('curling.lib.MockTastypieResource._call_request')
+    def test_opens(self, _call_request):
+        _call_request.return_value = self.error
+        self.fail()
+        eq_(self.breaker.state(self.key), 'open')
+        self.assertRaises(CircuitOpen, self.api.services.settings.get)
+        eq_(_call_request.call_count, 2)
+        # Other endpoints are fine.
+        eq_(self.breaker.state('services.settings.POST'), 'closed')
+
+    @mock.patch('curling.lib.MockTastypieResource._call_request')
+    def test_threshold(self, _call_request):
+        _call_request.side_effect = [self.ok, self.ok, self.ok, self.error]
+        self.api.services.settings.get()
+        self.api.services.settings.get()
+        self.api.services.settings.get()
+        self.fail(1)
+        eq_(self.breaker.state(self.key), 'closed')
+
+    @mock.patch('curling.lib.MockTastypieResource._call_request')
+    def test_connection_error(self, _call_request):
+        _call_request.side_effect = ConnectionError
+        self.fail()
+        eq_(self.breaker.state(self.key), 'open')
+
+    @mock.patch('curling.lib.MockTastypieResource._call_request')
+    def test_slow(self, _call_request):
+        self.breaker.slow = 1
+        _call_request.return_value = self.ok
+        seconds = (i * 2 for i in itertools.count())
+        with mock.patch('time.time', side_effect=seconds):
+            self.api.services.settings.get()
+            self.api.services.settings.get()
+        eq_(self.breaker.state(self.key), 'open')
+
+    @mock.patch('curling.breaker.time.time')
+    @mock.patch('curling.lib.MockTastypieResource._call_request')
+    def test_half_open(self, _call_request, time):
+        time.return_value = 0
+        _call_request.return_value = self.error
+        self.fail()
+
+        time.return_value = 11
+        self.fail(1)
+        eq_(self.breaker.state(self.key), 'open')
+        self.assertRaises(CircuitOpen, self.api.services.settings.get)
+
+        time.return_value = 22
+        _call_request.return_value = self.ok
+        self.api.services.settings.get()
+        eq_(self.breaker.state(self.key), 'closed')
+
+    @mock.patch('curling.breaker.time.time')
+    def test_one_probe(self, time):
+        time.return_value = 0
+        for x in range(2):
+            self.breaker.record(self.key, False, 0)
+        time.return_value = 11
+        ok_(self.breaker.allow(self.key))
+        ok_(not self.breaker.allow(self.key))
+
+
+class TestCoalesce(unittest.TestCase):
+
+    def setUp(self):
+        self.api = lib.MockAPI('', coalesce=True)
+        self.release = threading.Event()
+        lib.statsd.reset()
+
+    def slow(self, *args, **kw):
+        self.release.wait()
+        return mock.Mock(status_code=200, content='{"a": 1}',
+                         headers={'content-type': 'application/json'})
+
+    def run_threads(self, *calls):
+        results = []
+        threads = [threading.Thread(target=lambda c=c: results.append(c()))
+                   for c in calls]
+        for thread in threads:
+            thread.start()
+        # Give them all a chance to start waiting.
+        time.sleep(0.1)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        return results
+
+    @mock.patch('curling.lib.MockTastypieResource._call_request')
+    def test_coalesce(self, _call_request):
+        _call_request.side_effect = self.slow
+        res = self.run_threads(*[self.api.services.settings.get] * 5)
+        eq_(res, [{'a': 1}] * 5)
+        eq_(_call_request.call_count, 1)
+        eq_(lib.statsd.cache['services.settings.GET.coalesced|count'],
+            [[1, 1]] * 4)
+
+    @mock.patch('curling.lib.MockTastypieResource._call_request')
+    def test_not_shared(self, _call_request):
+        _call_request.side_effect = self.slow
+        res = self.run_threads(*[self.api.services.settings.get] * 3)
+        eq_(len(set(map(id, res))), 3)
+
+    @mock.patch('curling.lib.MockTastypieResource._call_request')
+    def test_different(self, _call_request):
+        _call_request.side_effect = self.slow
+        self.run_threads(lambda: self.api.services.settings.get(a=1),
+                         lambda: self.api.services.settings.get(a=2),
+                         lambda: self.api.services.settings.get(
+                             headers={'If-None-Match': 'a'}),
+                         lambda: self.api.services.settings.post({}))
+        eq_(_call_request.call_count, 4)
+
+    def test_off(self):
+        ok_('flights' not in lib.MockAPI('')._store)
+
+    def test_error(self):
+        flights = SingleFlight()
+        error = ValueError()
+
+        def fail():
+            self.release.wait()
+            raise error
+
+        def call():
+            try:
+                flights.do('key', fail)
+            except ValueError, exc:
+                return exc
+
+        eq_(self.run_threads(call, call), [error, error])
+
+
+class TestHooks(unittest.TestCase):
+
+    def setUp(self):
+        self.aggregator = Aggregator()
+        self.api = lib.MockAPI('http://foo.com', hooks=[self.aggregator])
+        self.ok = mock.Mock(status_code=201, content='{"a": 1}',
+                            headers={'content-type': 'application/json'})
+        lib.statsd.reset()
+
+    def names(self):
+        return [name for name, event in self.aggregator.events]
+
+    @mock.patch('curling.lib.MockTastypieResource._call_request')
+    def test_post(self, _call_request):
+        _call_request.return_value = self.ok
+        self.api.services.settings.post({'b': 2})
+        eq_(self.names(), ['pre_request', 'post_response', 'post_parse'])
+        event = self.aggregator.events[-1][1]
+        eq_(event['key'], 'services.settings.POST')
+        eq_(event['status_code'], 201)
+        eq_(event['request_bytes'], len('{"b": 2}'))
+        eq_(event['response_bytes'], len('{"a": 1}'))
+        eq_(set(event['timings'].keys()),
+            set(['serialize', 'sign', 'network', 'deserialize']))
+
+    @mock.patch('curling.lib.MockTastypieResource._call_request')
+    def test_signed_headers(self, _call_request):
+        _call_request.return_value = self.ok
+        self.api.activate_oauth('key', 'secret')
+        self.api.services.settings.get()
+        ok_('Authorization' in self.aggregator.events[0][1]['headers'])
+
+    @mock.patch('curling.lib.MockTastypieResource._call_request')
+    def test_error(self, _call_request):
+        _call_request.return_value = mock.Mock(status_code=404, headers={},
+                                               content='')
+        self.assertRaises(lib.HttpClientError, self.api.services.settings.get)
+        eq_(self.names(), ['pre_request', 'post_response', 'error'])
+        ok_(isinstance(self.aggregator.events[-1][1]['error'],
+                       lib.HttpClientError))
+
+    @mock.patch('curling.lib.MockTastypieResource._call_request')
+    def test_aggregate(self, _call_request):
+        _call_request.return_value = self.ok
+        self.api.services.settings.post({'b': 2})
+        self.api.services.settings.post({'b': 2})
+        summary = self.aggregator.summary()
+        eq_(summary['services.settings.POST.network']['count'], 2)
+        eq_(self.aggregator.counts['services.settings.POST.bytes_sent'], 16)
+
+    @mock.patch('curling.lib.MockTastypieResource._call_request')
+    def test_statsd(self, _call_request):
+        _call_request.return_value = self.ok
+        api = lib.MockAPI('http://foo.com', hooks=[lib.StatsdHook()])
+        api.services.settings.post({'b': 2})
+        eq_(lib.statsd.cache['services.settings.POST.bytes_sent|count'],
+            [[8, 1]])
+        eq_(len(lib.statsd.timings), 5)
+
+    def test_none(self):
+        eq_(lib.MockAPI('').services.settings._event('GET'), None)
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.client = StatsClient(prefix='p', max_size=45, interval=60)
+        self.client._sock = mock.Mock()
+
+    def tearDown(self):
+        self.client.stop()
+
+    def sent(self):
+        return [c[0][0] for c in self.client._sock.sendto.call_args_list]
+
+    def test_counters(self):
+        self.client.incr('a')
+        self.client.incr('a', 2)
+        eq_(self.sent(), [])
+        self.client.flush()
+        eq_(self.sent(), ['p.a:3|c'])
+
+    def test_batches(self):
+        for x in range(3):
+            self.client.timing('timer', 10)
+        eq_(self.sent(), [])
+        self.client.timing('timer', 10)
+        eq_(self.sent(), ['\n'.join(['p.timer:10|ms'] * 3), 'p.timer:10|ms'])
+
+    def test_interval(self):
+        self.client.incr('a')
+        with mock.patch('curling.metrics.time.time', return_value=10 ** 10):
+            self.client.incr('a')
+        eq_(self.sent(), ['p.a:2|c'])
+
+    def test_idle(self):
+        client = StatsClient(prefix='p', interval=0.01)
+        client._sock = mock.Mock()
+        try:
+            client.incr('a')
+            for x in range(100):
+                if client._sock.sendto.called:
+                    break
+                time.sleep(0.01)
+        finally:
+            client.stop()
+        eq_(client._sock.sendto.call_args[0][0], 'p.a:1|c')
+
+    def test_thread_once(self):
+        with mock.patch('curling.metrics.threading.Thread') as thread:
+            self.client.incr('a')
+            self.client.incr('b')
+        eq_(thread.call_count, 1)
+        ok_(thread.return_value.daemon)
+
+    @mock.patch('curling.metrics.random.random')
+    def test_rate(self, random):
+        random.return_value = 0.2
+        self.client.incr('a', rate=0.1)
+        self.client.incr('b', rate=0.5)
+        self.client.timing('c', 1, rate=0.5)
+        self.client.flush()
+        eq_(self.sent(), ['p.c:1|ms|@0.5\np.b:1|c|@0.5'])
+
+    def test_key(self):
+        eq_(lib._key('http://f.com/a/b/1/', 'GET'), 'a.b.1.GET')
+        eq_(lib._keys[('http://f.com/a/b/1/', 'GET')], 'a.b.1.GET')
+
+    def test_sample_rate(self):
+        rates = {'a': 0.5, 'a.b.GET': 0.1}
+        eq_(lib._sample_rate(rates, 'a.b.GET'), 0.1)
+        eq_(lib._sample_rate(rates, 'a.b.POST'), 0.5)
+        eq_(lib._sample_rate(rates, 'c.GET'), 1)
+        eq_(lib._sample_rate(0.3, 'c.GET'), 0.3)
+
+    def test_api_rate(self):
+        api = lib.MockAPI('', sample_rate={'services': 0.5})
+        lib.statsd.reset()
+        api.services.settings.get()
+        eq_(lib.statsd.cache, {'services.settings.GET.200|count': [[1, 0.5]]})
+
+
+class TestFakeTransport(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeTransport()
+        self.api = lib.API('http://f.com', transport=self.fake)
+
+    def test_get(self):
+        self.fake.add('GET', r'^/services/settings/$', body={'foo': 'bar'})
+        eq_(self.api.services.settings.get(), {'foo': 'bar'})
+        call = self.fake.calls[0]
+        eq_((call.method, call.url),
+            ('GET', 'http://f.com/services/settings/'))
+
+    def test_first_match(self):
+        self.fake.add('GET', r'^/services/settings/1/$', body={'id': 1})
+        self.fake.add(None, r'^/services/settings/', body={'id': 2})
+        eq_(self.api.services.settings(1).get(), {'id': 1})
+        eq_(self.api.services.settings(2).get(), {'id': 2})
+        eq_(self.api.services.settings.post({}), {'id': 2})
+        eq_([route.count for route in self.fake.routes], [1, 2])
+
+    @raises(lib.HttpClientError)
+    def test_not_found(self):
+        self.api.services.settings.get()
+
+    def test_handler(self):
+        self.fake.add('POST', r'^/services/settings/$',
+                      handler=lambda call: (201, json.loads(call.data)))
+        eq_(self.api.services.settings.post({'foo': 'bar'}), {'foo': 'bar'})
+
+    def test_response(self):
+        self.fake.add('GET', r'^/services/settings/$',
+                      handler=lambda call: Response(204))
+        eq_(self.api.services.settings.get(), '')
+
+    @raises(lib.HttpServerError)
+    def test_error_status(self):
+        self.fake.add('GET', r'^/services/settings/$', error=503)
+        self.api.services.settings.get()
+
+    def test_error_retried(self):
+        route = self.fake.add('GET', r'^/services/settings/$', body={},
+                              error=ConnectionError, error_rate=0.5)
+        api = lib.API('http://f.com', transport=self.fake,
+                      retry=Retry(attempts=3, backoff=0))
+        with mock.patch('curling.fake.random.random') as random:
+            random.side_effect = [0.1, 0.9]
+            eq_(api.services.settings.get(), {})
+        eq_(route.count, 2)
+
+    @mock.patch('curling.fake.time.sleep')
+    def test_latency(self, sleep):
+        self.fake.add('GET', r'^/services/settings/$', latency=0.5)
+        self.api.services.settings.get()
+        sleep.assert_called_with(0.5)
+
+    def test_log_size(self):
+        fake = FakeTransport(log_size=2)
+        api = lib.API('http://f.com', transport=fake)
+        fake.add('GET', r'^/services/settings/', body={})
+        for pk in range(3):
+            api.services.settings(pk).get()
+        eq_([call.url for call in fake.calls],
+            ['http://f.com/services/settings/1/',
+             'http://f.com/services/settings/2/'])
+
+    def test_stream(self):
+        self.fake.add('GET', r'^/services/settings/$',
+                      body={'meta': {}, 'objects': [{'a': 1}, {'b': 2}]})
+        eq_(list(self.api.services.settings.stream(chunk_size=4)),
+            [{'a': 1}, {'b': 2}])
+
+
+class TestCompact(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeTransport()
+        self.fake.add('GET', r'^/services/settings/$', body={
+            'meta': {'limit': 20, 'total_count': 185},
+            'objects': [{'key': 'ADMINS', 'value': []},
+                        {'key': 'DEBUG', 'value': True},
+                        {'key': 'EXTRA', 'value': 1, 'other': 2}]})
+        self.fake.add('GET', r'^/services/settings/1/$',
+                      body={'meta': {}, 'objects': [{'key': 'ADMINS'}]})
+
+    def get(self, compact):
+        api = lib.API('http://f.com', transport=self.fake, compact=compact)
+        return api.services.settings.get()
+
+    def test_list(self):
+        res = self.get(True)
+        ok_(isinstance(res, CompactList))
+        eq_(len(res), 3)
+        eq_(res.limit, 20)
+        eq_(res.total_count, 185)
+        eq_(res[0], {'key': 'ADMINS', 'value': []})
+        ok_(isinstance(res[0], dict))
+
+    @raises(AttributeError)
+    def test_no_meta(self):
+        self.get(True).offset
+
+    def test_records(self):
+        res = self.get('records')
+        ok_(not any(isinstance(obj, Record) for obj in res.objects))
+        eq_(res[1].value, True)
+        eq_(res[1]['key'], 'DEBUG')
+        ok_(isinstance(res.objects[1], Record))
+        ok_(not isinstance(res.objects[0], Record))
+        eq_(list(res), [{'key': 'ADMINS', 'value': []},
+                        {'key': 'DEBUG', 'value': True},
+                        {'key': 'EXTRA', 'value': 1, 'other': 2}])
+        # The last one has other fields, so it's left as a dict.
+        eq_([type(obj).__name__ for obj in res.objects],
+            ['Record', 'Record', 'dict'])
+
+    def test_fields(self):
+        res = self.get(['key', 'value'])
+        eq_(res[0:2], [{'key': 'ADMINS', 'value': []},
+                       {'key': 'DEBUG', 'value': True}])
+
+    def test_get_object(self):
+        api = lib.API('http://f.com', transport=self.fake, compact='records')
+        eq_(api.services.settings(1).get_object().key, 'ADMINS')
+
+    @raises(MultipleObjectsReturned)
+    def test_get_object_multiple(self):
+        api = lib.API('http://f.com', transport=self.fake, compact=True)
+        api.services.settings.get_object()
+
+    def test_record(self):
+        cls = record_class(['b', 'a'])
+        eq_(cls.__slots__, ('a', 'b'))
+        ok_(record_class(['a', 'b']) is cls)
+        record = cls({'a': 1, 'b': 2})
+        eq_(record.get('c', 3), 3)
+        eq_(record.to_dict(), {'a': 1, 'b': 2})
+        ok_('a' in record)
+        ok_(record != {'a': 1})
+
+    def test_not_identifiers(self):
+        res = CompactList({'meta': {}, 'objects': [{'a-b': 1}]}, records=True)
+        eq_(res.record, None)
+        eq_(res[0], {'a-b': 1})
+
+
+class TestSchemas(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeTransport()
+        self.fake.add('GET', r'^/generic/$', body={
+            'buyer': {'list_endpoint': '/generic/buyer/',
+                      'schema': '/generic/buyer/schema/'},
+            'transaction': {'list_endpoint': '/generic/transaction/',
+                            'schema': '/generic/transaction/schema/'}})
+        self.fake.add('GET', r'^/generic/buyer/schema/$', body={
+            'allowed_list_http_methods': ['get', 'post'],
+            'allowed_detail_http_methods': ['get', 'patch'],
+            'fields': {'uuid': {'nullable': False},
+                       'email': {'nullable': True}}})
+        self.fake.add('GET', r'^/generic/transaction/schema/$', body={})
+        self.fake.add(None, r'^/generic/buyer/', body={})
+        self.schemas = Schemas(roots=['generic'])
+        self.api = lib.API('http://f.com', transport=self.fake,
+                           schemas=self.schemas)
+
+    def requested(self):
+        return [call.url for call in self.fake.calls]
+
+    def test_lazy(self):
+        eq_(self.requested(), [])
+        self.api.generic.buyer.get()
+        self.api.generic.buyer(1).get()
+        eq_(self.requested(), ['http://f.com/generic/',
+                               'http://f.com/generic/buyer/schema/',
+                               'http://f.com/generic/buyer/',
+                               'http://f.com/generic/buyer/1/'])
+
+    def test_not_allowed(self):
+        try:
+            self.api.generic.buyer.delete()
+        except MethodNotAllowed, exc:
+            eq_(exc.response.status_code, 405)
+            ok_(isinstance(exc, lib.HttpClientError))
+        else:
+            self.fail('MethodNotAllowed not raised')
+        ok_('http://f.com/generic/buyer/' not in self.requested())
+
+    def test_allowed(self):
+        self.api.generic.buyer(1).patch({'email': 'a@b.com'})
+        eq_(self.schemas.allowed('http://f.com/generic/buyer/1/'),
+            ['GET', 'PATCH'])
+        eq_(self.schemas.allowed('http://f.com/generic/transaction/'), None)
+        eq_(self.schemas.allowed('http://f.com/other/'), None)
+
+    def test_validate(self):
+        try:
+            self.api.generic.buyer.post({'uuid': None, 'foo': 1})
+        except ValidationError, exc:
+            eq_(exc.content, {'uuid': ['This field cannot be null.'],
+                              'foo': ['Unknown field.']})
+        else:
+            self.fail('ValidationError not raised')
+        ok_('http://f.com/generic/buyer/' not in self.requested())
+
+    def test_validate_list(self):
+        try:
+            self.api.generic.buyer.post({'objects': [{'foo': 1},
+                                                     {'foo': 2}]})
+        except ValidationError, exc:
+            eq_(exc.content, {'foo': ['Unknown field.']})
+        else:
+            self.fail('ValidationError not raised')
+
+    def test_by_url(self):
+        eq_(self.api.by_url('/generic/buyer/1/')._url(),
+            'http://f.com/generic/buyer/1/')
+        eq_(self.schemas.parse('/generic/buyer/a/b/'),
+            (['generic', 'buyer'], 'a/b'))
+        eq_(self.schemas.parse('/other/thing/1/'), None)
+        eq_(self.api.by_url('/other/thing/1/')._url(),
+            'http://f.com/other/thing/1/')
+
+    def test_base_path(self):
+        fake = FakeTransport()
+        fake.add('GET', r'^/api/v1/$', body={
+            'buyer': {'list_endpoint': '/api/v1/generic/buyer/',
+                      'schema': '/api/v1/generic/buyer/schema/'}})
+        api = lib.API('http://f.com/api/v1', transport=fake,
+                      schemas=Schemas())
+        eq_(api.by_url('/api/v1/generic/buyer/1/')._url(),
+            'http://f.com/api/v1/generic/buyer/1/')
+
+    def test_ttl(self):
+        self.api.generic.buyer.get()
+        with mock.patch('curling.schema.time.time') as time:
+            time.return_value = 10 ** 10
+            self.api.generic.buyer.get()
+        eq_(self.requested().count('http://f.com/generic/'), 2)
+
+    def test_disk(self):
+        path = tempfile.mktemp()
+        try:
+            api = lib.API('http://f.com', transport=self.fake,
+                          schemas=Schemas(roots=['generic'], path=path))
+            api.generic.buyer.get()
+            fake = FakeTransport()
+            fake.add(None, r'^/generic/buyer/$', body={})
+            api = lib.API('http://f.com', transport=fake,
+                          schemas=Schemas(roots=['generic'], path=path))
+            api.generic.buyer.get()
+            eq_([call.url for call in fake.calls],
+                ['http://f.com/generic/buyer/'])
+        finally:
+            os.remove(path)
+
+    def test_root_fails(self):
+        fake = FakeTransport()
+        fake.add(None, r'^/generic/buyer/', body={'uuid': 'a'})
+        api = lib.API('http://f.com', transport=fake, schemas=Schemas())
+        eq_(api.generic.buyer.get(), {'uuid': 'a'})
+        eq_(api.by_url('/generic/buyer/1/').post({'foo': 1}), {'uuid': 'a'})
+        eq_([call.url for call in fake.calls],
+            ['http://f.com/', 'http://f.com/generic/buyer/',
+             'http://f.com/generic/buyer/1/'])
+
+    def test_root_not_a_dict(self):
+        fake = FakeTransport()
+        fake.add('GET', r'^/$', body=[1])
+        fake.add(None, r'^/generic/buyer/', body={})
+        api = lib.API('http://f.com', transport=fake, schemas=Schemas())
+        eq_(api.generic.buyer.get(), {})
+
+    def test_error_ttl(self):
+        fake = FakeTransport()
+        fake.add(None, r'^/generic/buyer/', body={})
+        api = lib.API('http://f.com', transport=fake,
+                      schemas=Schemas(error_ttl=60))
+        api.generic.buyer.get()
+        with mock.patch('curling.schema.time.time') as time:
+            time.return_value = 10 ** 10
+            api.generic.buyer.get()
+        eq_([call.url for call in fake.calls].count('http://f.com/'), 2)
+
+    def test_schema_fails(self):
+        self.fake.add('GET', r'^/generic/buyer/schema/$', error=503)
+        self.fake.routes.insert(0, self.fake.routes.pop())
+        self.api.generic.buyer.delete()
+        self.api.generic.buyer.post({'foo': 1})
+        eq_(self.requested().count('http://f.com/generic/buyer/schema/'), 1)
+
+
+class TestBulk(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeTransport()
+        self.route = self.fake.add('PATCH', r'^/generic/transaction/$',
+                                   status=202)
+        self.api = lib.API('http://f.com', transport=self.fake)
+
+    def sent(self):
+        return [json.loads(call.data) for call in self.fake.calls]
+
+    def test_create(self):
+        objects = ({'amount': str(i)} for i in range(5))
+        res = self.api.generic.transaction.bulk_create(objects, batch_size=2)
+        eq_(len(res), 3)
+        eq_(sorted(len(data['objects']) for data in self.sent()), [1, 2, 2])
+        eq_([chunk.data['objects'][0]['amount'] for chunk in res],
+            ['0', '2', '4'])
+        ok_(not any(chunk.error for chunk in res))
+
+    def test_empty(self):
+        eq_(self.api.generic.transaction.bulk_create([]), [])
+
+    @raises(ValueError)
+    def test_update_needs_uri(self):
+        self.api.generic.transaction.bulk_update([{'amount': '1'}])
+
+    def test_update(self):
+        self.api.generic.transaction.bulk_update(
+            [{'resource_uri': '/generic/transaction/1/', 'amount': '1'}])
+        eq_(self.sent(), [{'objects': [{'resource_uri':
+                                        '/generic/transaction/1/',
+                                        'amount': '1'}]}])
+
+    def test_delete(self):
+        self.api.generic.transaction.bulk_delete(
+            ['/generic/transaction/1/',
+             {'resource_uri': '/generic/transaction/2/'}])
+        eq_(self.sent(), [{'objects': [], 'deleted_objects':
+                           ['/generic/transaction/1/',
+                            '/generic/transaction/2/']}])
+
+    def test_failures(self):
+        def handler(call):
+            data = json.loads(call.data)
+            if data['objects'][0]['amount'] == '2':
+                return 400, {'amount': ['Bad amount.']}
+            return 202, ''
+        self.route.handler = handler
+        res = self.api.generic.transaction.bulk_create(
+            [{'amount': str(i)} for i in range(4)], batch_size=2, workers=2)
+        eq_([chunk.error is None for chunk in res], [True, False])
+        eq_(res[1].error.content, {'amount': ['Bad amount.']})
+        eq_(res[1].data, {'objects': [{'amount': '2'}, {'amount': '3'}]})
+
+
+class TestCompression(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeTransport()
+        self.route = self.fake.add(None, r'^/services/settings/$',
+                                   body={'foo': 'bar'})
+        self.api = lib.API('http://f.com', transport=self.fake,
+                           compression=Compression(threshold=20))
+        lib.statsd.reset()
+
+    def test_accept(self):
+        self.api.services.settings.get()
+        eq_(self.fake.calls[0].headers['Accept-Encoding'], 'gzip, deflate')
+
+    @mock.patch('curling.compression.brotli')
+    def test_accept_brotli(self, brotli):
+        compression = Compression()
+        eq_(compression.accept(), 'br, gzip, deflate')
+        eq_(compression.accept(stream=True), 'gzip, deflate')
+
+    def test_compress(self):
+        self.api.services.settings.post({'foo': 'x' * 20})
+        call = self.fake.calls[0]
+        eq_(call.headers['Content-Encoding'], 'gzip')
+        eq_(json.loads(zlib.decompress(call.data, 16 + zlib.MAX_WBITS)),
+            {'foo': 'x' * 20})
+        eq_(lib.statsd.cache['services.settings.POST.request_bytes.raw|count'],
+            [[31, 1]])
+
+    def test_small(self):
+        self.api.services.settings.post({'foo': 'x'})
+        ok_('Content-Encoding' not in self.fake.calls[0].headers)
+
+    def test_not_get(self):
+        eq_(Compression(threshold=1).compress('GET', 'data'), None)
+
+    def test_never(self):
+        eq_(Compression(threshold=None).compress('POST', 'x' * 2000), None)
+
+    @mock.patch('curling.compression.brotli')
+    def test_decode(self, brotli):
+        brotli.decompress.return_value = '{"foo": "brotli"}'
+        api = lib.API('http://f.com', transport=self.fake,
+                      compression=Compression())
+        self.route.response.headers['Content-Encoding'] = 'br'
+        eq_(api.services.settings.get(), {'foo': 'brotli'})
+        brotli.decompress.assert_called_with('{"foo": "bar"}')
+
+    @mock.patch('curling.compression.brotli')
+    def test_decode_twice(self, brotli):
+        brotli.decompress.side_effect = lambda content: content.upper()
+        api = lib.API('http://f.com', transport=self.fake,
+                      compression=Compression())
+        self.route.response.headers['Content-Encoding'] = 'br'
+        eq_(api.services.settings.get(), {'FOO': 'BAR'})
+        eq_(api.services.settings.get(), {'FOO': 'BAR'})
+        eq_(brotli.decompress.call_args_list,
+            [mock.call('{"foo": "bar"}')] * 2)
+        eq_(self.route.response.content, '{"foo": "bar"}')
+
+    @mock.patch('curling.compression.BUILTIN', ('gzip', 'deflate', 'br'))
+    @mock.patch('curling.compression.brotli')
+    def test_decoded_by_urllib3(self, brotli):
+        compression = Compression()
+        eq_(compression.decode('br', 'foo', mock.Mock(spec=HTTPResponse)),
+            None)
+        ok_(not brotli.decompress.called)
+        # Other transports leave it to us.
+        compression.decode('br', 'foo', mock.Mock())
+        brotli.decompress.assert_called_with('foo')
+
+    def test_counts(self):
+        self.api.services.settings.get()
+        eq_(lib.statsd.cache['services.settings.GET.response_bytes.received'
+                             '|count'], [[14, 1]])
+        eq_(lib.statsd.cache['services.settings.GET.response_bytes.raw'
+                             '|count'], [[14, 1]])
+
+
+class TestStartup(unittest.TestCase):
+
+    def test_config_cached(self):
+        path = tempfile.mktemp()
+        try:
+            with open(path, 'w') as config:
+                json.dump({'f.com': {'key': 'k'}}, config)
+            eq_(command.read_config(path), {'f.com': {'key': 'k'}})
+            with mock.patch('curling.command.json.load') as load:
+                command.read_config(path)
+                ok_(not load.called)
+            os.utime(path, (0, 0))
+            with mock.patch('curling.command.json.load') as load:
+                command.read_config(path)
+                ok_(load.called)
+        finally:
+            os.remove(path)
+
+    def test_no_config(self):
+        eq_(command.read_config('/does/not/exist'), None)
+
+    def test_null_statsd(self):
+        statsd = lib.NullStatsd()
+        statsd.incr('foo', rate=0.5)
+        with statsd.timer('foo'):
+            pass
+
+    def test_lazy_statsd(self):
+        client = mock.Mock()
+        with mock.patch.object(lib, 'statsd', lib.LazyStatsd()):
+            with mock.patch('django_statsd.clients.statsd', client):
+                lib.statsd.incr('foo')
+                ok_(lib.statsd is client)
+        client.incr.assert_called_with('foo')
+
+
+class TestLoad(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeTransport()
+        self.fake.add('GET', r'^/services/settings/$', body={})
+        self.fake.add('GET', r'^/services/error/$', status=500)
+        self.patcher = mock.patch('curling.command.make_api',
+                                  functools.partial(command.make_api,
+                                                    transport=self.fake))
+        self.patcher.start()
+        self.statsd = lib.statsd
+
+    def tearDown(self):
+        self.patcher.stop()
+        lib.statsd = self.statsd
+
+    def config(self, **kw):
+        defaults = {'url': 'http://f.com/services/settings/', 'data': None,
+                    'request': 'GET', 'number': 4, 'concurrency': 2,
+                    'rate': None, 'urls': None}
+        defaults.update(kw)
+        return mock.Mock(**defaults)
+
+    @mock.patch('sys.stdout', new_callable=StringIO.StringIO)
+    def test_load(self, stdout):
+        command.load(self.config())
+        eq_(len(self.fake.calls), 4)
+        out = stdout.getvalue()
+        ok_('Requests:     4' in out, out)
+        ok_('200           4  100.0%' in out, out)
+
+    @mock.patch('sys.stdout', new_callable=StringIO.StringIO)
+    def test_urls(self, stdout):
+        path = tempfile.mktemp()
+        try:
+            with open(path, 'w') as urls:
+                urls.write('http://f.com/services/settings/\n'
+                           '# A comment.\n\n'
+                           'http://f.com/services/error/ {"a": 1}\n')
+            eq_(command.read_targets(self.config(urls=path)),
+                [('http://f.com/services/settings/', None),
+                 ('http://f.com/services/error/', {'a': 1})])
+            command.load(self.config(urls=path, number=None))
+        finally:
+            os.remove(path)
+        eq_(len(self.fake.calls), 2)
+        out = stdout.getvalue()
+        ok_('200           1   50.0%' in out, out)
+        ok_('500           1   50.0%' in out, out)
+
+    @raises(ValueError)
+    def test_no_urls(self):
+        path = tempfile.mktemp()
+        try:
+            with open(path, 'w') as urls:
+                urls.write('# Just a comment.\n\n')
+            command.read_targets(self.config(urls=path))
+        finally:
+            os.remove(path)
+
+    @mock.patch('sys.stdout', new_callable=StringIO.StringIO)
+    def test_report_nothing(self, stdout):
+        command.report([], 0, self.config())
+        ok_('Requests:     0' in stdout.getvalue(), stdout.getvalue())
+
+    @raises(SystemExit)
+    @mock.patch('sys.stderr', new_callable=StringIO.StringIO)
+    @mock.patch('sys.argv', ['curling', '-c', '0', '-n', '4', 'http://f.com'])
+    def test_no_concurrency(self, stderr):
+        command.main()
+
+    @mock.patch('sys.stdout', new_callable=StringIO.StringIO)
+    def test_hosts_and_query(self, stdout):
+        path = tempfile.mktemp()
+        try:
+            with open(path, 'w') as urls:
+                urls.write('http://f.com/services/settings/?a=1\n'
+                           'http://g.com/services/settings/\n')
+            command.load(self.config(urls=path, number=None))
+        finally:
+            os.remove(path)
+        eq_(sorted((call.url, call.params) for call in self.fake.calls),
+            [('http://f.com/services/settings/', {'a': '1'}),
+             ('http://g.com/services/settings/', {})])
+
+    @mock.patch('sys.stdout', new_callable=StringIO.StringIO)
+    def test_unparseable(self, stdout):
+        self.fake.add('GET', r'^/services/bad/$', body='{nope',
+                      headers={'Content-Type': 'application/json'})
+        command.load(self.config(url='http://f.com/services/bad/'))
+        ok_('error         4  100.0%' in stdout.getvalue(), stdout.getvalue())
+
+    @mock.patch('sys.stdout', new_callable=StringIO.StringIO)
+    @mock.patch('curling.command.time.sleep')
+    def test_rate(self, sleep, stdout):
+        command.load(self.config(rate=0.5, concurrency=1, number=2))
+        # The second request waits two seconds after the first.
+        ok_([c for c in sleep.call_args_list if c[0][0] > 1])
+
+    def test_percentile(self):
+        values = range(1, 101)
+        eq_(command.percentile(values, 50), 50)
+        eq_(command.percentile(values, 99), 99)
+        eq_(command.percentile(values, 100), 100)
+        eq_(command.percentile([5], 90), 5)
+
+
+class TestShowStream(unittest.TestCase):
+
+    def setUp(self):
+        self.data = {'meta': {'limit': 2},
+                     'objects': [{'a': 1}, {'b': [1, 2]}]}
+        self.out = StringIO.StringIO()
+
+    def stream(self, data):
+        return TastypieStream([json.dumps(data)])
+
+    @mock.patch('curling.command.highlight', lambda text: text)
+    def test_pretty(self):
+        command.show_stream(self.stream(self.data), self.out)
+        self.data['meta']['headers'] = None
+        eq_(json.loads(self.out.getvalue()), self.data)
+
+    @mock.patch('curling.command.highlight', lambda text: text)
+    def test_meta_last(self):
+        res = TastypieStream(['{"objects": [{"a": 1}], "meta": {"x": 1}}'])
+        command.show_stream(res, self.out)
+        eq_(json.loads(self.out.getvalue()),
+            {'objects': [{'a': 1}], 'meta': {'x': 1, 'headers': None}})
+
+    @mock.patch('curling.command.highlight')
+    def test_limit(self, highlight):
+        highlight.side_effect = lambda text: '*' + text
+        with mock.patch('curling.command.HIGHLIGHT_LIMIT', 70):
+            command.show_stream(self.stream(self.data), self.out)
+        # The meta and the first object are highlighted, then it stops.
+        eq_(highlight.call_count, 2)
+
+    @mock.patch('sys.stdout', new_callable=StringIO.StringIO)
+    @mock.patch('curling.command.highlight')
+    def test_show_limit(self, highlight, stdout):
+        with mock.patch('curling.command.HIGHLIGHT_LIMIT', 10):
+            command.show(self.data)
+        ok_(not highlight.called)
+        eq_(json.loads(stdout.getvalue()), self.data)
+
+    def test_raw(self):
+        command.show_raw(self.stream(self.data), self.out)
+        eq_([json.loads(line) for line in self.out.getvalue().splitlines()],
+            self.data['objects'])
+
+    def test_raw_object(self):
+        command.show_raw(self.stream({'a': 1, 'b': 2}), self.out)
+        eq_(self.out.getvalue(), json.dumps({'a': 1, 'b': 2}) + '\n')
+
+    def test_extra(self):
+        res = self.stream({'meta': {}, 'objects': [], 'other': [1]})
+        eq_(res.extra, {'other': [1]})
+
+
+class H2Response(object):
+    """Enough of a hyper response for HTTP2Adapter."""
+
+    def __init__(self, body, status=200):
+        self.status = status
+        self.reason = 'OK'
+        self.headers = mock.Mock()
+        self.headers.iter_raw.return_value = [
+            ('content-type', 'application/json')]
+        self.body = StringIO.StringIO(body)
+
+    def read(self, amt=None, decode_content=True):
+        return self.body.read(amt)
+
+
+class H2Error(Exception):
+    pass
+
+
+@mock.patch('curling.http2.HTTP20Error', H2Error)
+@mock.patch('curling.http2.HTTP20Connection')
+class TestHTTP2(unittest.TestCase):
+
+    def setUp(self):
+        self.patcher = mock.patch('curling.http2.init_context')
+        self.init_context = self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def api(self):
+        return lib.API('http://foo.com', http2=True)
+
+    def test_adapter(self, connection):
+        api = self.api()
+        adapter = api._store['session'].adapters['http://']
+        ok_(isinstance(adapter, http2.HTTP2Adapter))
+        eq_(api._store['session'].adapters['https://'], adapter)
+
+    def test_request(self, connection):
+        conn = connection.return_value
+        conn.request.return_value = 3
+        conn.get_response.return_value = H2Response('{"a": 1}')
+        eq_(self.api().services.settings.get(foo='bar'), {'a': 1})
+        connection.assert_called_with('foo.com', 80, secure=False,
+                                      ssl_context=None)
+        method, selector, body, headers = conn.request.call_args[0]
+        eq_((method, selector), ('GET', '/services/settings/?foo=bar'))
+        ok_('Connection' not in headers)
+        conn.get_response.assert_called_with(3)
+
+    def test_one_connection(self, connection):
+        connection.return_value.get_response.side_effect = (
+            lambda stream_id: H2Response('{}'))
+        api = self.api()
+        api.services.settings.get()
+        api.by_url('/services/other/').post({'a': 1})
+        eq_(connection.call_count, 1)
+        eq_(connection.return_value.request.call_args[0][2], '{"a": 1}')
+
+    def test_secure(self, connection):
+        connection.return_value.get_response.return_value = H2Response('{}')
+        api = lib.API('https://foo.com:8443', http2=True)
+        api._store['session'].trust_env = False
+        api.services.settings.get()
+        connection.assert_called_with('foo.com', 8443, secure=True,
+                                      ssl_context=None)
+
+    @raises(lib.HttpServerError)
+    def test_error(self, connection):
+        connection.return_value.get_response.side_effect = H2Error
+        self.api().services.settings.get()
+
+    def test_error_reconnects(self, connection):
+        conn = connection.return_value
+        conn.get_response.side_effect = H2Error
+        api = self.api()
+        self.assertRaises(lib.HttpServerError, api.services.settings.get)
+        ok_(conn.close.called)
+        conn.get_response.side_effect = lambda stream_id: H2Response('{}')
+        api.services.settings.get()
+        eq_(connection.call_count, 2)
+
+    def test_close(self, connection):
+        connection.return_value.get_response.return_value = H2Response('{}')
+        api = self.api()
+        api.services.settings.get()
+        api._store['session'].close()
+        ok_(connection.return_value.close.called)
+
+    @raises(ValueError)
+    def test_timeout(self, connection):
+        lib.API('http://foo.com', http2=True, timeout=5)
+
+    @raises(ValueError)
+    def test_timeout_transport(self, connection):
+        lib.API('http://foo.com', timeout=5,
+                transport=lib.make_session(http2=True))
+
+    @raises(ValueError)
+    def test_request_timeout(self, connection):
+        session = lib.make_session(http2=True)
+        session.get('http://foo.com/', timeout=5)
+
+    @raises(ValueError)
+    def test_proxy(self, connection):
+        session = lib.make_session(http2=True)
+        session.get('http://foo.com/', proxies={'http': 'http://proxy'})
+
+    def test_verify(self, connection):
+        connection.return_value.get_response.return_value = H2Response('{}')
+        session = lib.make_session(http2=True)
+        session.trust_env = False
+        session.get('https://foo.com/', verify=False)
+        session.get('https://foo.com/', verify='/ca.pem')
+        session.get('https://foo.com/')
+        eq_(connection.call_count, 3)
+        eq_(self.init_context.call_args_list,
+            [mock.call(cert_path=None, cert=None),
+             mock.call(cert_path='/ca.pem', cert=None)])
+        eq_(connection.call_args[1]['ssl_context'], None)
+
+    def test_not_installed(self, connection):
+        with mock.patch('curling.http2.HTTP20Connection', None):
+            self.assertRaises(ImportError, self.api)
+
+
+class TestLimit(unittest.TestCase):
+
+    def setUp(self):
+        lib.statsd.reset()
+        self.fake = FakeTransport()
+        self.fake.add(None, r'^/', body={})
+
+    def api(self, **kw):
+        return lib.API('http://f.com', transport=self.fake, limit=Limit(**kw))
+
+    @mock.patch('curling.limit.time')
+    def test_rate(self, time):
+        time.time.return_value = 100
+        bucket = Bucket(rate=10, burst=2)
+        eq_(bucket.acquire(), 0)
+        eq_(bucket.acquire(), 0)
+        ok_(not time.sleep.called)
+        bucket.acquire()
+        bucket.acquire()
+        eq_([round(c[0][0], 3) for c in time.sleep.call_args_list],
+            [0.1, 0.2])
+
+    @mock.patch('curling.limit.time')
+    def test_refill(self, time):
+        time.time.return_value = 100
+        bucket = Bucket(rate=10, burst=1, timeout=0)
+        eq_(bucket.acquire(), 0)
+        eq_(bucket.acquire(), None)
+        time.time.return_value = 100.1
+        eq_(bucket.acquire(), 0)
+
+    def test_concurrency(self):
+        bucket = Bucket(concurrency=1, timeout=0)
+        eq_(bucket.acquire(), 0)
+        eq_(bucket.acquire(), None)
+        bucket.release()
+        eq_(bucket.acquire(), 0)
+
+    def test_concurrency_timeout(self):
+        bucket = Bucket(concurrency=1, timeout=0.01)
+        bucket.acquire()
+        start = time.time()
+        eq_(bucket.acquire(), None)
+        ok_(time.time() - start >= 0.01)
+
+    def test_token_returned(self):
+        bucket = Bucket(rate=1, burst=1, concurrency=1, timeout=0)
+        bucket.in_flight = 1
+        eq_(bucket.acquire(), None)
+        bucket.release()
+        eq_(bucket.acquire(), 0)
+
+    def test_in_flight(self):
+        counts, lock = [0, 0], threading.Lock()
+
+        def handler(call):
+            with lock:
+                counts[0] += 1
+                counts[1] = max(counts)
+            time.sleep(0.005)
+            with lock:
+                counts[0] -= 1
+            return 200, {}
+
+        self.fake.add(None, r'^/services/', handler=handler)
+        self.fake.routes.reverse()
+        api = self.api(concurrency=2)
+        pool = ThreadPool(5)
+        pool.map(lambda i: api.services.settings(i).get(), range(20))
+        pool.close()
+        eq_(counts[1], 2)
+        eq_(api._store['limit'].api.in_flight, 0)
+
+    @raises(LimitExceeded)
+    def test_reject(self):
+        api = self.api(rate=1, timeout=0)
+        api.services.settings.get()
+        api.services.settings.get()
+
+    def test_reject_stats(self):
+        api = self.api(concurrency=1, timeout=0)
+        api._store['limit'].api.in_flight = 1
+        self.assertRaises(lib.HttpServerError, api.services.settings.get)
+        eq_(lib.statsd.cache['services.settings.GET.limit_exceeded|count'],
+            [[1, 1]])
+        eq_(len(self.fake.calls), 0)
+
+    def test_stats(self):
+        self.api(rate=100).services.settings.get()
+        eq_(lib.statsd.cache['services.settings.GET.limit.waiting|gauge'],
+            [[0, 1]])
+        ok_('services.settings.GET.limit.wait|timing' in
+            [t[0] for t in lib.statsd.timings])
+
+    def test_endpoints(self):
+        api = self.api(concurrency=5, endpoints={
+            'generic.buyer': {'concurrency': 1, 'timeout': 0}})
+        limit = api._store['limit']
+        eq_(limit.buckets('generic.buyer.1.GET'),
+            [limit.endpoints['generic.buyer'], limit.api])
+        eq_(limit.buckets('generic.seller.GET'), [limit.api])
+
+        limit.endpoints['generic.buyer'].in_flight = 1
+        api.generic.seller.get()
+        self.assertRaises(LimitExceeded, api.generic.buyer(2).get)
+        # The limit for the whole API is given back.
+        eq_(limit.api.in_flight, 0)
+
+    def test_endpoints_only(self):
+        limit = Limit(endpoints={'generic': {'rate': 1}})
+        eq_(limit.api, None)
+        eq_(limit.buckets('services.settings.GET'), [])
+
+    def test_released_on_error(self):
+        self.fake.add(None, r'^/services/', error=ConnectionError)
+        self.fake.routes.reverse()
+        api = self.api(concurrency=1, timeout=0)
+        for i in range(2):
+            self.assertRaises(lib.HttpServerError, api.services.settings.get)
+        eq_(api._store['limit'].api.in_flight, 0)
+
+    def test_retries_limited(self):
+        self.fake.add(None, r'^/services/', error=503)
+        self.fake.routes.reverse()
+        api = lib.API('http://f.com', transport=self.fake,
+                      limit=Limit(rate=1, timeout=0),
+                      retry=Retry(attempts=3, backoff=0))
+        self.assertRaises(LimitExceeded, api.services.settings.get)
+        eq_(len(self.fake.calls), 1)
@@ -1,5 +1,13 @@
+import sys
+
 from setuptools import setup
 
+install_requires = ['argparse', 'requests>=1.2.0', 'PyJWT-mozilla', 'mock',
+                    'slumber>=0.5.3', 'Django', 'pygments', 'oauth2>=1.5.211',
+                    'httplib2', 'django-statsd-mozilla>=0.3.8.6',
+                    'statsd>=1.0.0']
+if sys.version_info < (2, 7):
+    install_requires.append('ordereddict')
 
 setup(
     name='curling',
@@ -9,10 +17,7 @@ setup(
     author='Andy McKay',
     author_email='andym@mozilla.com',
     license='BSD',
-    install_requires=['argparse', 'requests>=1.2.0', 'PyJWT-mozilla',
-                      'mock', 'slumber>=0.5.3', 'Django', 'pygments',
-                      'oauth2>=1.5.211', 'httplib2',
-                      'django-statsd-mozilla>=0.3.8.6', 'statsd>=1.0.0'],
+    install_requires=install_requires,
     packages=['curling'],
     url='https://github.com/andymckay/curling',
     include_package_data=True,